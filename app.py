@@ -5,9 +5,12 @@ Implements the /match workflow from gphoto-phash-flask as a modern PWA.
 """
 
 import json
+import queue
 import os
 import base64
 import argparse
+import collections
+import contextlib
 import socket
 import sys
 import signal
@@ -17,20 +20,16 @@ import hmac
 import hashlib
 import datetime
 import functools
+import time
 from io import BytesIO
-try:
-    from PIL import Image as PILImage
-    _PIL_AVAILABLE = True
-except ImportError:
-    _PIL_AVAILABLE = False
+from urllib.parse import quote
 
 from flask import (
     Flask, request, jsonify, render_template, g, send_from_directory, abort
 )
-from flask_caching import Cache
 
-import psycopg2
-import psycopg2.extras
+# PIL, psycopg2 and flask_caching are imported on first use (see _pil(),
+# connect_db() and get_cache()) so a restart can bind its socket sooner.
 
 # ─── APP SETUP ────────────────────────────────────────────────────────────────
 
@@ -40,11 +39,28 @@ app.secret_key = os.environ.get("FLASK_SECRET", "photo-match-pwa-secret-key-chan
 HAMMING_DISTANCE_THRESHOLD = int(os.environ.get("HAMMING_THRESHOLD", "10"))
 
 # ─── UNDO STATE ───────────────────────────────────────────────────────────────
-# Stores enough info to reverse the most recent commit
-_last_commit = {
-    "wa_id":        None,
-    "prev_id_hash": None,   # value before the commit (to restore on undo)
-}
+# Stores enough info to reverse the most recent commit, per reviewer session
+# (the page's X-Session-Id; "" for clients that don't send one). Only sessions
+# with something to undo have an entry.
+_last_commits = {}
+_last_commits_lock = threading.Lock()
+
+def last_commit(holder):
+    """This session's undoable commit, or None."""
+    with _last_commits_lock:
+        return _last_commits.get(holder or "")
+
+def remember_commit(holder, wa_id, prev_id_hash, member_ids):
+    with _last_commits_lock:
+        _last_commits[holder or ""] = {
+            "wa_id":        wa_id,
+            "prev_id_hash": prev_id_hash,   # value before the commit (to restore on undo)
+            "member_ids":   member_ids,     # near-duplicates committed along with it (were unmatched)
+        }
+
+def forget_commit(holder):
+    with _last_commits_lock:
+        _last_commits.pop(holder or "", None)
 
 # ─── CACHING ──────────────────────────────────────────────────────────────────
 # Server-side cache: simple in-memory (swap to Redis by changing CACHE_TYPE)
@@ -55,48 +71,188 @@ cache_config = {
 if cache_config["CACHE_TYPE"] == "RedisCache":
     cache_config["CACHE_REDIS_URL"] = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 
-cache = Cache(app, config=cache_config)
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Create the Flask-Caching object on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from flask_caching import Cache
+                _cache = Cache(app, config=cache_config)
+    return _cache
+
+def cached(timeout):
+    """Like `cache.cached(timeout=...)`, but binds the cache on the first call."""
+    def decorator(view):
+        wrapped = None
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            nonlocal wrapped
+            if wrapped is None:
+                wrapped = get_cache().cached(timeout=timeout)(view)
+            return wrapped(*args, **kwargs)
+        return wrapper
+    return decorator
 
 # ─── VERSION ──────────────────────────────────────────────────────────────────
+# Deploys stamp the version into VERSION (display line + full sha) so startup
+# reads a file instead of spawning git. git is only used if the stamp is
+# missing or no longer matches HEAD.
 
-def get_version():
-    """Return short git hash + date, or 'dev' if git unavailable."""
+APP_DIR      = os.path.dirname(os.path.abspath(__file__))
+VERSION_FILE = os.path.join(APP_DIR, "VERSION")
+
+def _git_head_sha():
+    """Resolve HEAD by reading .git directly; None if it can't be determined."""
+    git_dir = os.path.join(APP_DIR, ".git")
     try:
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-        sha = subprocess.check_output(
-            ["git", "-C", app_dir, "rev-parse", "--short", "HEAD"],
-            stderr=subprocess.DEVNULL).decode().strip()
-        date = subprocess.check_output(
-            ["git", "-C", app_dir, "log", "-1", "--format=%cd", "--date=short"],
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[5:]
+        ref_path = os.path.join(git_dir, *ref.split("/"))
+        if os.path.exists(ref_path):
+            with open(ref_path) as f:
+                return f.read().strip()
+        with open(os.path.join(git_dir, "packed-refs")) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except OSError:
+        pass
+    return None
+
+def stamp_version():
+    """Write VERSION from git (called after every pull). Returns the display version."""
+    try:
+        out = subprocess.check_output(
+            ["git", "-C", APP_DIR, "log", "-1", "--format=%h (%cd)%n%H", "--date=short"],
             stderr=subprocess.DEVNULL).decode().strip()
-        return f"{sha} ({date})"
     except (subprocess.CalledProcessError, FileNotFoundError):
         return "dev"
+    try:
+        with open(VERSION_FILE, "w") as f:
+            f.write(out + "\n")
+    except OSError:
+        pass
+    return out.splitlines()[0]
+
+def get_version():
+    """Return short git hash + date from the VERSION stamp, falling back to git, or 'dev'."""
+    try:
+        with open(VERSION_FILE) as f:
+            lines = f.read().splitlines()
+        head = _git_head_sha()
+        if lines and (head is None or (len(lines) > 1 and lines[1] == head)):
+            return lines[0]
+    except OSError:
+        pass
+    return stamp_version()
 
 APP_VERSION = get_version()
 
 # ─── DATABASE ─────────────────────────────────────────────────────────────────
 
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+CONFIG_PATH = os.environ.get("PHOTO_MATCH_CONFIG") or os.path.join(os.path.dirname(__file__), "config.json")
+
+def connect_db():
+    """Open a new connection from config.json (for CLI tools and long-lived streams)."""
+    if not os.path.exists(CONFIG_PATH):
+        raise RuntimeError("config.json not found — copy config.example.json and fill in your credentials")
+    import psycopg2
+    with open(CONFIG_PATH) as f:
+        cfg = json.load(f)
+    conn = psycopg2.connect(
+        database=cfg["DB_NAME"],
+        user=cfg["DB_USER"],
+        password=cfg["DB_PASSWORD"],
+        host=cfg.get("DB_HOST", "localhost"),
+        port=cfg.get("DB_PORT", 5432),
+    )
+    with conn.cursor() as cur:
+        cur.execute("SET TIME ZONE 'UTC';")
+    return conn
+
+def ensure_schema(conn):
+    """
+    Add the columns/tables this app owns on top of the documented schema.
+    Every statement is idempotent. ALTER TABLE needs table ownership (checked
+    even when nothing changes), so this is an explicit step — scripts/migrate.py,
+    run by setup/deploy, or migrate_on_startup() when something is missing —
+    rather than something every connection does.
+    """
+    with conn.cursor() as cur:
+        # When the reviewer last decided on the row (commit / skip / undo)
+        cur.execute("ALTER TABLE wa ADD COLUMN IF NOT EXISTS decided_at timestamptz")
+        # Representative wa id of the row's near-duplicate group (see cluster_wa)
+        cur.execute("ALTER TABLE wa ADD COLUMN IF NOT EXISTS cluster_id integer")
+        cur.execute("CREATE INDEX IF NOT EXISTS wa_cluster_id_idx ON wa (cluster_id)")
+        # Which reviewer session is working on a queue item, and until when (see claim_next)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS wa_lease (
+                wa_id      integer PRIMARY KEY,
+                holder     text NOT NULL,
+                expires_at timestamptz NOT NULL
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS wa_lease_expires_idx ON wa_lease (expires_at)")
+    conn.commit()
+
+def missing_schema(conn):
+    """What ensure_schema() would add that isn't there yet (read-only, any role)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = to_regclass('wa') AND attname IN ('decided_at', 'cluster_id') AND NOT attisdropped
+        """)
+        have = {f"wa.{r[0]}" for r in cur.fetchall()}
+        cur.execute("SELECT to_regclass('wa_lease') IS NOT NULL")
+        if cur.fetchone()[0]:
+            have.add("wa_lease")
+    conn.rollback()
+    return [name for name in ("wa.decided_at", "wa.cluster_id", "wa_lease") if name not in have]
 
 def get_db():
     """Get or create a database connection for this request context."""
     if "conn" not in g:
-        if not os.path.exists(CONFIG_PATH):
-            raise RuntimeError("config.json not found — copy config.example.json and fill in your credentials")
-        with open(CONFIG_PATH) as f:
-            cfg = json.load(f)
-        g.conn = psycopg2.connect(
-            database=cfg["DB_NAME"],
-            user=cfg["DB_USER"],
-            password=cfg["DB_PASSWORD"],
-            host=cfg.get("DB_HOST", "localhost"),
-            port=cfg.get("DB_PORT", 5432),
-        )
+        import psycopg2.extras
+        g.conn = connect_db()
         g.cur = g.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        g.cur.execute("SET TIME ZONE 'UTC';")
     return g.conn, g.cur
 
+SSE_DB_POOL = int(os.environ.get("SSE_DB_POOL", "4"))
+_db_pool = queue.LifoQueue()
+_db_pool_slots = threading.BoundedSemaphore(SSE_DB_POOL)
+
+@contextlib.contextmanager
+def pooled_db():
+    """
+    Borrow a (conn, DictCursor) from a small shared pool for work outside a
+    request (SSE streams). At most SSE_DB_POOL are open at once.
+    """
+    import psycopg2.extras
+    with _db_pool_slots:
+        try:
+            conn = _db_pool.get_nowait()
+        except queue.Empty:
+            conn = connect_db()
+        ok = False
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                yield conn, cur
+            conn.rollback()
+            ok = True
+        finally:
+            if ok and not conn.closed:
+                _db_pool.put(conn)
+            else:
+                conn.close()
+
 @app.teardown_appcontext
 def close_db(error):
     cur  = g.pop("cur",  None)
@@ -109,7 +265,17 @@ def close_db(error):
 def hamming_distance(h1, h2):
     if h1 is None or h2 is None:
         return None
-    return bin(int(h1) ^ int(h2)).count("1")
+    # Hashes are stored as signed BIGINT; compare the 64-bit patterns
+    return bin((int(h1) ^ int(h2)) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+@functools.lru_cache(maxsize=None)
+def _pil():
+    """PIL.Image, imported on first use; None if Pillow is not installed."""
+    try:
+        from PIL import Image as PILImage
+        return PILImage
+    except ImportError:
+        return None
 
 def pixel_distance(thumb_a: bytes, thumb_b: bytes, size: int = 32) -> float | None:
     """
@@ -117,7 +283,8 @@ def pixel_distance(thumb_a: bytes, thumb_b: bytes, size: int = 32) -> float | No
     Both are resized to `size`x`size` greyscale before comparison.
     Lower = more similar. Returns None if PIL unavailable or images unreadable.
     """
-    if not _PIL_AVAILABLE or not thumb_a or not thumb_b:
+    PILImage = _pil()
+    if PILImage is None or not thumb_a or not thumb_b:
         return None
     try:
         def load(data):
@@ -149,7 +316,183 @@ def thumbnail_b64(data):
         data = bytes(data)
     return base64.b64encode(data).decode("utf-8")
 
-# ─── WEBHOOK (auto-deploy on push) ────────────────────────────────────────────
+# ─── DEPLOY / HOT RESTART ─────────────────────────────────────────────────────
+# On POSIX a deploy hands the listening socket to a fresh process: the child
+# inherits the fd, warms up, signals ready over a pipe, and only then does the
+# old process stop accepting, drain in-flight requests and exit. Windows (and
+# --debug, which runs under the reloader) keep the old restart-in-place path.
+
+LISTEN_FD_ENV   = "PHOTO_MATCH_LISTEN_FD"
+READY_FD_ENV    = "PHOTO_MATCH_READY_FD"
+HANDOFF_TIMEOUT = int(os.environ.get("HANDOFF_TIMEOUT", "60"))
+DRAIN_TIMEOUT   = int(os.environ.get("DRAIN_TIMEOUT", "30"))
+
+_server   = None    # werkzeug server, set by serve() (None under --debug)
+_draining = False
+_inflight = 0
+_inflight_lock = threading.Lock()
+_deploy_lock   = threading.Lock()
+
+class _InflightTracker:
+    """WSGI middleware counting responses not yet closed, for draining."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+        global _inflight
+
+        def _start_response(status, headers, exc_info=None):
+            if _draining:
+                # Make keep-alive clients reconnect (to the new process)
+                headers = [h for h in headers if h[0].lower() != "connection"]
+                headers.append(("Connection", "close"))
+            return start_response(status, headers, exc_info)
+
+        with _inflight_lock:
+            _inflight += 1
+        try:
+            return ClosingIterator(self.wsgi_app(environ, _start_response), [_request_done])
+        except BaseException:
+            _request_done()
+            raise
+
+def _request_done():
+    global _inflight
+    with _inflight_lock:
+        _inflight -= 1
+
+app.wsgi_app = _InflightTracker(app.wsgi_app)
+
+def _venv_python():
+    import platform
+    if platform.system() == "Windows":
+        python = os.path.join(APP_DIR, "venv", "Scripts", "python.exe")
+    else:
+        python = os.path.join(APP_DIR, "venv", "bin", "python")
+    return python if os.path.exists(python) else sys.executable
+
+def _notify_systemd(message):
+    """sd_notify() without libsystemd; no-op outside a Type=notify unit."""
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return
+    if addr.startswith("@"):
+        addr = "\0" + addr[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+            s.sendto(message.encode(), addr)
+    except OSError:
+        pass
+
+def _restart_in_place():
+    """Replace this process outright (Windows / --debug). Drops connections."""
+    import platform, tempfile
+    python = _venv_python()
+    argv = [python, os.path.join(APP_DIR, "app.py")] + sys.argv[1:]
+    if platform.system() == "Windows":
+        args = " ".join(f'"{a}"' for a in argv)
+        bat = os.path.join(tempfile.gettempdir(), "_photo_match_restart.bat")
+        with open(bat, "w") as f:
+            f.write(f"@echo off\ntimeout /t 2 /nobreak >nul\n{args}\n")
+        subprocess.Popen(
+            ["cmd", "/c", bat],
+            creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
+            close_fds=True,
+        )
+        os._exit(0)
+    else:
+        os.execv(python, argv)
+
+def hot_restart():
+    """
+    Start a new process on our listening socket and hand over once it is ready.
+    Returns False (and keeps serving) if the new process fails to come up.
+    """
+    import select
+    global _draining
+    try:
+        save_snapshot()   # the new process starts from our warm state
+    except Exception as e:
+        app.logger.error(f"snapshot before restart failed: {e}", exc_info=True)
+    fd = _server.socket.fileno()
+    os.set_inheritable(fd, True)
+    r, w = os.pipe()
+    env = dict(os.environ, **{LISTEN_FD_ENV: str(fd), READY_FD_ENV: str(w)})
+    child = subprocess.Popen(
+        [_venv_python(), os.path.join(APP_DIR, "app.py")] + sys.argv[1:],
+        env=env, pass_fds=(fd, w),
+    )
+    os.close(w)
+    try:
+        readable, _, _ = select.select([r], [], [], HANDOFF_TIMEOUT)
+        ready = bool(readable) and os.read(r, 1) == b"1"
+    finally:
+        os.close(r)
+    if not ready:
+        app.logger.error(f"hot restart: new process (pid {child.pid}) never became ready")
+        child.kill()
+        child.wait()
+        return False
+    print(f"  hot restart: pid {child.pid} is ready, draining pid {os.getpid()}", flush=True)
+    _notify_systemd(f"MAINPID={child.pid}")
+    _draining = True
+    _server.shutdown()   # stop accepting; serve() drains and exits
+    return True
+
+def _handover_safe():
+    """
+    The socket handover changes the main PID. Under systemd that is only safe
+    with the bundled Type=notify unit (NOTIFY_SOCKET set); an older
+    Type=simple unit would see the main process exit and kill the new one too.
+    """
+    return bool(os.environ.get("NOTIFY_SOCKET")) or not os.environ.get("INVOCATION_ID")
+
+def restart_onto_new_code():
+    """Hot restart where possible, else restart in place. True once handed off."""
+    if _server is None or os.name == "nt" or not _handover_safe():
+        _restart_in_place()
+        return False
+    return hot_restart()
+
+def do_deploy():
+    """git pull and, if HEAD moved, restart onto the new code."""
+    if not _deploy_lock.acquire(blocking=False):
+        print("  deploy: already in progress", flush=True)
+        return
+    handed_off = False
+    try:
+        before = _git_head_sha()
+        subprocess.run(["git", "-C", APP_DIR, "pull"], check=True, timeout=120)
+        after = _git_head_sha()
+        if before and before == after:
+            print(f"  deploy: HEAD unchanged ({after[:7]}), not restarting", flush=True)
+            return
+        stamp_version()
+        migrated = subprocess.run([_venv_python(), os.path.join(APP_DIR, "scripts", "migrate.py")], timeout=300)
+        if migrated.returncode:
+            app.logger.error("deploy: schema migration failed — run scripts/migrate.py as the owner of table wa")
+        handed_off = restart_onto_new_code()
+    except Exception as e:
+        app.logger.error(f"deploy error: {e}", exc_info=True)
+    finally:
+        if not handed_off:   # keep the lock once handed off: this process is on its way out
+            _deploy_lock.release()
+
+def reload():
+    """Hot-restart onto the code already on disk (SIGHUP / systemctl reload)."""
+    if not _deploy_lock.acquire(blocking=False):
+        return
+    handed_off = False
+    try:
+        stamp_version()
+        handed_off = restart_onto_new_code()
+    except Exception as e:
+        app.logger.error(f"reload error: {e}", exc_info=True)
+    finally:
+        if not handed_off:
+            _deploy_lock.release()
 
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
 
@@ -167,69 +510,19 @@ def github_webhook():
     if request.headers.get("X-GitHub-Event") != "push":
         return jsonify({"ok": True, "action": "ignored"})
 
-    def do_deploy():
-        import platform, tempfile
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-        subprocess.run(["git", "-C", app_dir, "pull"], check=True)
-        if platform.system() == "Windows":
-            python = os.path.join(app_dir, "venv", "Scripts", "python.exe")
-            if not os.path.exists(python):
-                python = sys.executable
-            args = " ".join(f'"{a}"' for a in [python, os.path.join(app_dir, "app.py")] + sys.argv[1:])
-            bat = os.path.join(tempfile.gettempdir(), "_photo_match_restart.bat")
-            with open(bat, "w") as f:
-                f.write(f"@echo off\ntimeout /t 2 /nobreak >nul\n{args}\n")
-            subprocess.Popen(
-                ["cmd", "/c", bat],
-                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
-                close_fds=True,
-            )
-            os._exit(0)
-        else:
-            python = os.path.join(app_dir, "venv", "bin", "python")
-            if not os.path.exists(python):
-                python = sys.executable
-            os.execv(python, [python, os.path.join(app_dir, "app.py")] + sys.argv[1:])
-
     threading.Thread(target=do_deploy, daemon=True).start()
     return jsonify({"ok": True, "action": "deploying"})
 
-# ─── MANUAL DEPLOY ────────────────────────────────────────────────────────────
-
 @app.route("/api/deploy", methods=["POST"])
 def manual_deploy():
     """Manual deploy trigger from the UI."""
-    def do_deploy():
-        import platform, tempfile
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-        subprocess.run(["git", "-C", app_dir, "pull"], check=True)
-        if platform.system() == "Windows":
-            python = os.path.join(app_dir, "venv", "Scripts", "python.exe")
-            if not os.path.exists(python):
-                python = sys.executable
-            args = " ".join(f'"{a}"' for a in [python, os.path.join(app_dir, "app.py")] + sys.argv[1:])
-            bat = os.path.join(tempfile.gettempdir(), "_photo_match_restart.bat")
-            with open(bat, "w") as f:
-                f.write(f"@echo off\ntimeout /t 2 /nobreak >nul\n{args}\n")
-            subprocess.Popen(
-                ["cmd", "/c", bat],
-                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
-                close_fds=True,
-            )
-            os._exit(0)
-        else:
-            python = os.path.join(app_dir, "venv", "bin", "python")
-            if not os.path.exists(python):
-                python = sys.executable
-            os.execv(python, [python, os.path.join(app_dir, "app.py")] + sys.argv[1:])
-
     threading.Thread(target=do_deploy, daemon=True).start()
     return jsonify({"ok": True, "action": "deploying"})
 
 # ─── VERSION API ──────────────────────────────────────────────────────────────
 
 @app.route("/api/version")
-@cache.cached(timeout=60)
+@cached(timeout=60)
 def api_version():
     return jsonify({"version": APP_VERSION})
 
@@ -306,267 +599,1006 @@ def serve_wa_thumbnail(wa_id):
         pass
     abort(404)
 
-# ─── MATCH API ────────────────────────────────────────────────────────────────
+# ─── MEDIA PREVIEWS (downscaled renditions of WA originals) ───────────────────
+# /api/media-preview/<filename>?w= renders a JPEG (images) or poster frame
+# (videos, via ffmpeg) on a small thread pool and keeps it on disk; the cache
+# is trimmed oldest-used-first past MEDIA_PREVIEW_CACHE_MB. /api/media/<filename>
+# serves the original with Range support so video can stream on demand.
+
+MEDIA_PREVIEW_DIR      = os.environ.get("MEDIA_PREVIEW_DIR", os.path.join("static", "previews_cache"))
+MEDIA_PREVIEW_WIDTHS   = (360, 720, 1440)   # requested widths snap up to one of these
+MEDIA_PREVIEW_CACHE_MB = int(os.environ.get("MEDIA_PREVIEW_CACHE_MB", "500"))
+MEDIA_PREVIEW_WORKERS  = int(os.environ.get("MEDIA_PREVIEW_WORKERS", "2"))
+VIDEO_EXTS = (".mp4", ".mov", ".3gp", ".m4v")
+
+_preview_pool = None
+_preview_jobs = {}          # cache file name → Future, so concurrent requests share one render
+_preview_lock = threading.Lock()
+_preview_trimmed = 0.0
+
+def media_path(filename):
+    """Absolute path of a WA original under static/, or None if not a Media… file."""
+    from werkzeug.security import safe_join
+    if not filename.startswith("Media"):
+        return None
+    path = safe_join(app.static_folder, filename)
+    return path if path and os.path.isfile(path) else None
 
-@app.route("/api/match")
-@app.route("/api/match/<int:offset>")
-def api_match(offset=0):
+def video_frame(path, width=None, quality=None):
     """
-    Return the next unmatched WA item and its candidate matches from hashes table.
-    Uses server-side caching with a short TTL (clears on commit).
+    One keyframe of a video as JPEG bytes via ffmpeg (None without ffmpeg or a
+    frame), at most `width` px wide if given. Shared with scripts/ingest_media.py.
     """
+    import shutil
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    opts = ["-vf", f"scale='min({width},iw)':-2"] if width else []
+    if quality:
+        opts += ["-q:v", str(quality)]
+    for seek in ("1", "0"):   # 1s in skips black intro frames; short clips fall back to 0
+        try:
+            out = subprocess.run(
+                [ffmpeg, "-v", "error", "-ss", seek, "-i", path, "-frames:v", "1", *opts,
+                 "-f", "image2pipe", "-vcodec", "mjpeg", "-"],
+                capture_output=True, timeout=60,
+            ).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if out:
+            return out
+    return None
+
+def _render_preview(src, dst, width):
+    """Write a JPEG rendition of `src` no wider/taller than `width` to `dst`; False if none."""
+    tmp = f"{dst}.{threading.get_ident()}.tmp"
     try:
-        conn, cur = get_db()
+        if src.lower().endswith(VIDEO_EXTS):
+            frame = video_frame(src, width, quality=4)
+            if not frame:
+                return False
+            with open(tmp, "wb") as f:
+                f.write(frame)
+        else:
+            from PIL import Image, ImageOps
+            with Image.open(src) as img:
+                img.draft("RGB", (width, width))   # JPEG: decode at reduced scale
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                img.thumbnail((width, width))
+                img.save(tmp, "JPEG", quality=80, progressive=True, optimize=True)
+        os.replace(tmp, dst)
+        return True
+    finally:
+        # Failed renders leave partial files that _trim_previews() doesn't count
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+
+def _trim_previews():
+    """Delete least recently used renditions until the cache fits MEDIA_PREVIEW_CACHE_MB."""
+    global _preview_trimmed
+    _preview_trimmed = time.monotonic()
+    entries = []
+    for e in os.scandir(MEDIA_PREVIEW_DIR):
+        if e.name.endswith(".jpg"):
+            st = e.stat()
+            entries.append((st.st_mtime, st.st_size, e.path))
+    total = sum(size for _, size, _ in entries)
+    cap = MEDIA_PREVIEW_CACHE_MB * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= cap:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def _forget_preview_job(name, job):
+    with _preview_lock:
+        if _preview_jobs.get(name) is job:
+            del _preview_jobs[name]
+
+def get_preview(filename, width):
+    """Path of the cached rendition, rendering it on the pool on first use; None if unavailable."""
+    global _preview_pool
+    src = media_path(filename)
+    if src is None:
+        return None
+    st = os.stat(src)
+    # Keyed on the original's size + mtime, so a replaced file gets fresh renditions
+    key = hashlib.sha1(f"{filename}|{st.st_size}|{st.st_mtime_ns}|{width}".encode()).hexdigest()[:24]
+    name = f"{key}.jpg"
+    path = os.path.join(MEDIA_PREVIEW_DIR, name)
+    if os.path.exists(path):
+        os.utime(path)   # mark as recently used for trimming
+        return path
+    with _preview_lock:
+        if _preview_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            os.makedirs(MEDIA_PREVIEW_DIR, exist_ok=True)
+            _preview_pool = ThreadPoolExecutor(max_workers=MEDIA_PREVIEW_WORKERS,
+                                               thread_name_prefix="preview")
+        job = _preview_jobs.get(name)
+        submitted = job is None
+        if submitted:
+            job = _preview_jobs[name] = _preview_pool.submit(_render_preview, src, path, width)
+    if submitted:
+        # Forget the job once it finishes, not when a waiter gives up, so a
+        # slow render isn't started again by the next request
+        job.add_done_callback(lambda j: _forget_preview_job(name, j))
+    ok = job.result(timeout=90)
+    if ok and time.monotonic() - _preview_trimmed > 30:
+        _trim_previews()
+    return path if ok else None
+
+@app.route("/api/media-preview/<path:filename>")
+def serve_media_preview(filename):
+    """Downscaled JPEG (or video poster frame). Query params: w=<width px, default 720>"""
+    want = request.args.get("w", 720, type=int)
+    width = next((w for w in MEDIA_PREVIEW_WIDTHS if w >= want), MEDIA_PREVIEW_WIDTHS[-1])
+    try:
+        path = get_preview(filename, width)
+    except Exception as e:
+        app.logger.error(f"preview error for {filename}: {e}", exc_info=True)
+        path = None
+    if path is None:
+        abort(404)
+    resp = send_from_directory(MEDIA_PREVIEW_DIR, os.path.basename(path), mimetype="image/jpeg")
+    resp.headers["Cache-Control"] = "public, max-age=604800"
+    return resp
+
+@app.route("/api/media/<path:filename>")
+def serve_media(filename):
+    """The WA original, with Range/conditional support (video seeks fetch only what's played)."""
+    from flask import send_file
+    path = media_path(filename)
+    if path is None:
+        abort(404)
+    resp = send_file(path, conditional=True, etag=True, max_age=604800)
+    resp.headers["Accept-Ranges"] = "bytes"
+    return resp
+
+# ─── MATCH CACHE + WARM-STATE SNAPSHOT ────────────────────────────────────────
+# find_candidates() results are kept per wa id (LRU). The cache and the undo
+# state are written to SNAPSHOT_PATH every SNAPSHOT_INTERVAL seconds and just
+# before a hot restart, and loaded on startup. A snapshot is only trusted if
+# its format, search settings and the max ids of hashes/partner still match the DB.
+
+SNAPSHOT_FORMAT   = 5   # bump whenever the payload shape changes
+SNAPSHOT_PATH     = os.environ.get("SNAPSHOT_PATH", os.path.join(APP_DIR, "warm_state.json.gz"))
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", "60"))
+MATCH_CACHE_SIZE  = int(os.environ.get("MATCH_CACHE_SIZE", "2000"))
+
+_match_cache = collections.OrderedDict()   # wa id → find_candidates() payload
+_match_cache_lock = threading.Lock()
+_match_cache_dirty = False
+_db_fingerprint = None
+
+def match_cache_get(wa_id):
+    with _match_cache_lock:
+        payload = _match_cache.get(wa_id)
+        if payload is not None:
+            _match_cache.move_to_end(wa_id)
+        return payload
+
+def match_cache_put(wa_id, payload):
+    global _match_cache_dirty
+    with _match_cache_lock:
+        _match_cache[wa_id] = payload
+        _match_cache.move_to_end(wa_id)
+        while len(_match_cache) > MATCH_CACHE_SIZE:
+            _match_cache.popitem(last=False)
+        _match_cache_dirty = True
+
+def match_cache_drop(*wa_ids):
+    """Forget cached payloads (all of them when called without ids)."""
+    global _match_cache_dirty
+    with _match_cache_lock:
+        if wa_ids:
+            for wa_id in wa_ids:
+                _match_cache.pop(wa_id, None)
+        else:
+            _match_cache.clear()
+        _match_cache_dirty = True
+
+def db_fingerprint(conn):
+    """Max ids of the candidate tables; if either moves, cached candidates may be stale."""
+    fp = {}
+    with conn.cursor() as cur:
+        for table in ("hashes", "partner"):
+            try:
+                cur.execute(f"SELECT max(id) FROM {table}")
+                fp[table] = cur.fetchone()[0]
+            except Exception:
+                conn.rollback()   # partner table may not exist
+                fp[table] = None
+    conn.rollback()
+    return fp
+
+def save_snapshot():
+    """Write the match cache + undo state atomically. Returns the number of items saved."""
+    import gzip
+    global _match_cache_dirty
+    with _match_cache_lock:
+        matches = {str(k): v for k, v in _match_cache.items()}
+        _match_cache_dirty = False
+    with _last_commits_lock:
+        last_commits = {k: dict(v) for k, v in _last_commits.items()}
+    snap = {
+        "format":      SNAPSHOT_FORMAT,
+        "search":      search_config(),
+        "fingerprint": _db_fingerprint,
+        "saved_at":    datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "last_commits": last_commits,
+        "matches":     matches,
+    }
+    tmp = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(snap, f)
+    os.replace(tmp, SNAPSHOT_PATH)
+    return len(matches)
+
+def load_snapshot(conn):
+    """Restore state from SNAPSHOT_PATH if it is still valid for this DB. Returns items loaded."""
+    import gzip
+    global _db_fingerprint
+    _db_fingerprint = db_fingerprint(conn)
+    try:
+        with gzip.open(SNAPSHOT_PATH, "rt", encoding="utf-8") as f:
+            snap = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if (snap.get("format") != SNAPSHOT_FORMAT
+            or snap.get("search") != search_config()
+            or snap.get("fingerprint") != _db_fingerprint):
+        return 0
+    matches = {int(k): v for k, v in snap.get("matches", {}).items()}
+    # Drop items that were decided since the snapshot was taken
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id FROM wa
+            WHERE id = ANY(%s) AND (id_hash IS NOT NULL OR processed IS NOT NULL)
+        """, (list(matches),))
+        for (wa_id,) in cur.fetchall():
+            matches.pop(wa_id, None)
+    conn.rollback()
+    with _match_cache_lock:
+        for wa_id, payload in matches.items():
+            _match_cache.setdefault(wa_id, payload)
+    for holder, state in (snap.get("last_commits") or {}).items():
+        if state.get("wa_id") is not None and last_commit(holder) is None:
+            remember_commit(holder, state["wa_id"], state.get("prev_id_hash"), state.get("member_ids") or [])
+    return len(matches)
+
+def refresh_snapshot():
+    """Periodic tick: drop the cache if hashes/partner changed, then save if dirty."""
+    global _db_fingerprint
+    conn = connect_db()
+    try:
+        fp = db_fingerprint(conn)
+    finally:
+        conn.close()
+    if _db_fingerprint is not None and fp != _db_fingerprint:
+        match_cache_drop()
+    _db_fingerprint = fp
+    if _match_cache_dirty:
+        save_snapshot()
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        try:
+            refresh_snapshot()
+        except Exception as e:
+            app.logger.error(f"snapshot error: {e}", exc_info=True)
 
-        # Count remaining
-        cur.execute("SELECT count(*) FROM wa WHERE id_hash IS NULL AND processed IS NULL")
-        count = cur.fetchone()[0]
+def migrate_on_startup(conn):
+    """
+    Apply ensure_schema() if anything is missing, e.g. the first start after a
+    deploy by an older process that didn't run scripts/migrate.py. A role that
+    doesn't own the tables just gets an error logged.
+    """
+    missing = missing_schema(conn)
+    if not missing:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET lock_timeout = '10s'")   # don't hang startup behind a long transaction on wa
+        ensure_schema(conn)
+        print(f"  schema: added {', '.join(missing)}", flush=True)
+    except Exception as e:
+        conn.rollback()
+        app.logger.error(f"database schema is out of date (missing {', '.join(missing)}) and could not be "
+                         f"migrated ({str(e).strip()}) — run scripts/migrate.py as the owner of table wa")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("RESET lock_timeout")
+        conn.commit()
 
-        if not count:
-            return jsonify({"count": 0, "item": None, "candidates": [], "partner_candidates": []})
+def restore_warm_state():
+    """Bring the schema up to date, load the snapshot (if any) and start the periodic writer."""
+    try:
+        conn = connect_db()
+        try:
+            migrate_on_startup(conn)
+            n = load_snapshot(conn)
+        finally:
+            conn.close()
+        if n:
+            print(f"  warm state: restored {n} match payloads", flush=True)
+    except Exception as e:
+        app.logger.warning(f"warm state not restored: {e}")
+    threading.Thread(target=_snapshot_loop, daemon=True).start()
+
+# ─── NEAR-DUPLICATE CLUSTERS ──────────────────────────────────────────────────
+# Forwarded WhatsApp media shows up in `wa` many times with (near-)identical
+# hashes. cluster_wa() groups pending rows whose hashes are within
+# WA_CLUSTER_DISTANCE bits (union-find), storing the representative's id in
+# wa.cluster_id. /api/match only presents representatives, and commit/skip
+# apply the decision to every pending member with one UPDATE.
+
+WA_CLUSTER_DISTANCE = int(os.environ.get("WA_CLUSTER_DISTANCE", "4"))
+
+# Pending rows that are presented: singletons, group representatives, and
+# members whose representative was decided outside the app
+PENDING_GROUPS_SQL = """
+    id_hash IS NULL AND processed IS NULL
+    AND (cluster_id IS NULL OR cluster_id = id OR NOT EXISTS (
+        SELECT 1 FROM wa r
+        WHERE r.id = wa.cluster_id AND r.id_hash IS NULL AND r.processed IS NULL))
+"""
 
-        # Fetch the item
+def near_duplicate_groups(items, distance):
+    """
+    Union-find over (id, hash) pairs within `distance` bits; returns groups of
+    ids (size > 1). Candidate pairs come from multi-index hashing: hashes within
+    `distance` bits agree exactly on at least one of `distance + 1` bit blocks.
+    """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    # Exact duplicates first, so the pairwise step only sees distinct hashes
+    by_hash = {}
+    for wa_id, h in items:
+        parent[wa_id] = wa_id
+        if h in by_hash:
+            union(by_hash[h], wa_id)
+        else:
+            by_hash[h] = wa_id
+
+    nblocks = distance + 1
+    for k in range(nblocks):
+        lo, hi = 64 * k // nblocks, 64 * (k + 1) // nblocks
+        mask = (1 << (hi - lo)) - 1
+        buckets = collections.defaultdict(list)
+        for h, wa_id in by_hash.items():
+            buckets[(h >> lo) & mask].append((h, wa_id))
+        for members in buckets.values():
+            for i in range(len(members)):
+                hx, a = members[i]
+                for hy, b in members[i + 1:]:
+                    if find(a) != find(b) and hamming_distance(hx, hy) <= distance:
+                        union(a, b)
+
+    groups = collections.defaultdict(list)
+    for wa_id in parent:
+        groups[find(wa_id)].append(wa_id)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+def cluster_wa(conn, distance=WA_CLUSTER_DISTANCE):
+    """
+    Recompute wa.cluster_id for all pending rows (images by `hash`, videos by
+    `video_thumb_hash`). The representative is the member /api/match would
+    show first. Returns (groups, rows grouped).
+    """
+    import psycopg2.extras
+    with conn.cursor() as cur:
         cur.execute("""
-            SELECT id, filename, filetype, hash, video_thumb_hash, ids_hash, thumbnail, timestamp
+            SELECT id, filetype, hash, video_thumb_hash, timestamp
             FROM wa
             WHERE id_hash IS NULL AND processed IS NULL
+        """)
+        rows = cur.fetchall()
+
+    info = {}
+    kinds = collections.defaultdict(list)
+    for wa_id, filetype, h, vth, ts in rows:
+        info[wa_id] = ts
+        if filetype in ("Video", "video/mp4") and vth is not None:
+            kinds["video"].append((wa_id, vth))
+        elif filetype in ("Image", "image/jpeg") and h is not None:
+            kinds["image"].append((wa_id, h))
+
+    def queue_order(wa_id):
+        # ORDER BY timestamp DESC (NULLs first in Postgres), id ASC
+        ts = info[wa_id]
+        return (ts is not None, -ts.timestamp() if ts else 0, wa_id)
+
+    pairs = []
+    groups = 0
+    for items in kinds.values():
+        for ids in near_duplicate_groups(items, distance):
+            rep_id = min(ids, key=queue_order)
+            pairs.extend((wa_id, rep_id) for wa_id in ids)
+            groups += 1
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE wa SET cluster_id = NULL
+            WHERE cluster_id IS NOT NULL AND id_hash IS NULL AND processed IS NULL
+        """)
+        psycopg2.extras.execute_values(cur, """
+            UPDATE wa SET cluster_id = v.cluster_id
+            FROM (VALUES %s) AS v(id, cluster_id)
+            WHERE wa.id = v.id
+        """, pairs, page_size=5000)
+    conn.commit()
+    return groups, len(pairs)
+
+def update_cluster(cur, cluster_id, wa_id, set_sql, params=()):
+    """
+    Apply `SET <set_sql>` to wa_id and the other pending members of its group
+    in one UPDATE; returns the members' ids (wa_id excluded).
+    """
+    cur.execute(f"""
+        UPDATE wa SET {set_sql}, decided_at = now()
+        WHERE id = %s OR (cluster_id = %s AND id_hash IS NULL AND processed IS NULL)
+        RETURNING id
+    """, tuple(params) + (wa_id, cluster_id))
+    return [r[0] for r in cur.fetchall() if r[0] != wa_id]
+
+# ─── TIME-SHARDED CANDIDATE SEARCH ────────────────────────────────────────────
+# Optional (TIME_SHARDED_SEARCH=1): instead of scanning all of hashes/partner,
+# search month-aligned windows around the WA timestamp — the first one covers
+# the auto-select windows (30/60 days) — and only widen to the next window,
+# and finally the rest of the table, while fewer than TIME_SHARD_MIN
+# candidates have been found. Needs an index on `timestamp` to pay off.
+
+TIME_SHARDED_SEARCH = os.environ.get("TIME_SHARDED_SEARCH", "0") == "1"
+TIME_SHARD_MONTHS   = [int(m) for m in os.environ.get("TIME_SHARD_MONTHS", "2,6,24").split(",")]
+TIME_SHARD_MIN      = int(os.environ.get("TIME_SHARD_MIN", "1"))
+
+def search_config():
+    """Settings that change candidate results (cached payloads depend on them)."""
+    return {
+        "threshold":    HAMMING_DISTANCE_THRESHOLD,
+        "time_sharded": TIME_SHARD_MONTHS if TIME_SHARDED_SEARCH else None,
+        "shard_min":    TIME_SHARD_MIN if TIME_SHARDED_SEARCH else None,
+        "top_k":        CANDIDATE_TOP_K or None,
+        "max_radius":   CANDIDATE_MAX_RADIUS if CANDIDATE_TOP_K else None,
+    }
+
+def month_start(ts, months=0):
+    """First instant of the month `months` away from ts's month (keeps tzinfo)."""
+    y, m = divmod(ts.year * 12 + ts.month - 1 + months, 12)
+    return ts.replace(year=y, month=m + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def month_windows(ts):
+    """[lo, hi) windows of ±N whole months around ts, innermost first."""
+    return [(month_start(ts, -n), month_start(ts, n + 1)) for n in TIME_SHARD_MONTHS]
+
+def search_candidates(cur, sql, params, wa_ts):
+    """
+    Run a candidate query whose WHERE clause ends in `{time_filter}`.
+    Unsharded (or without a WA timestamp) this is one plain query; sharded it
+    searches each month window's new ring in turn, then everything left.
+    Returns (rows, complete) — complete is False if sharding stopped before
+    the rest of the table was searched.
+    """
+    if not TIME_SHARDED_SEARCH or wa_ts is None:
+        cur.execute(sql.format(time_filter=""), params)
+        return cur.fetchall(), True
+
+    rows = []
+    prev = None
+    complete = False
+    for lo, hi in month_windows(wa_ts):
+        time_filter = "AND timestamp >= %s AND timestamp < %s"
+        extra = [lo, hi]
+        if prev:
+            time_filter += " AND NOT (timestamp >= %s AND timestamp < %s)"
+            extra += list(prev)
+        cur.execute(sql.format(time_filter=time_filter), tuple(params) + tuple(extra))
+        rows.extend(cur.fetchall())
+        prev = (lo, hi)
+        if len(rows) >= TIME_SHARD_MIN:
+            break
+    else:
+        cur.execute(
+            sql.format(time_filter="AND (timestamp IS NULL OR NOT (timestamp >= %s AND timestamp < %s))"),
+            tuple(params) + tuple(prev),
+        )
+        rows.extend(cur.fetchall())
+        complete = True
+
+    # Same order as the unsharded query: timestamp ASC (NULLs last), id DESC
+    rows.sort(key=_candidate_order)
+    return rows, complete
+
+# ─── CANDIDATE QUERIES (radius or top-K) ──────────────────────────────────────
+# Radius mode returns every row within HAMMING_DISTANCE_THRESHOLD, however many
+# that is. Top-K mode (CANDIDATE_TOP_K > 0) returns the K nearest rows instead,
+# optionally no further than CANDIDATE_MAX_RADIUS, using `ORDER BY col <-> target
+# LIMIT K` so an index whose operator class supports `<->` ordering can answer
+# it without visiting the rest of the neighbourhood. Time sharding only applies
+# to radius mode.
+
+CANDIDATE_TOP_K      = int(os.environ.get("CANDIDATE_TOP_K", "0"))
+CANDIDATE_MAX_RADIUS = int(os.environ.get("CANDIDATE_MAX_RADIUS", "0"))   # 0 = unbounded
+
+HASHES_COLUMNS = """id, filename, hash, video_thumb_hash, camera_name, location,
+                   timestamp, url, preview_url,
+                   origin, size, filesize, thumbnail"""
+PARTNER_COLUMNS = """id, filename, camera_name, location, timestamp, url, hash,
+                   size, filesize, thumbnail"""
+
+def _candidate_order(r):
+    # timestamp ASC (NULLs last), id DESC — what the auto-select rules expect
+    return (r["timestamp"] is None, r["timestamp"] or 0, -r["id"])
+
+def nearest_candidates(cur, table, select, select_params, probes):
+    """Top-K: one index-ordered query per probe, merged by distance."""
+    best = {}
+    for column, target in probes:
+        if target is None:
+            continue
+        radius, params = "", list(select_params) + [target]
+        if CANDIDATE_MAX_RADIUS:
+            radius = f"AND {column} <@ (%s, %s)"
+            params += [target, CANDIDATE_MAX_RADIUS]
+        cur.execute(f"""
+            SELECT {select}, {column} <-> %s AS nn_dist
+            FROM {table}
+            WHERE {column} IS NOT NULL {radius}
+            ORDER BY {column} <-> %s
+            LIMIT %s
+        """, params + [target, CANDIDATE_TOP_K])
+        for r in cur.fetchall():
+            if r["id"] not in best or r["nn_dist"] < best[r["id"]]["nn_dist"]:
+                best[r["id"]] = r
+    rows = sorted(best.values(), key=lambda r: (r["nn_dist"], -r["id"]))[:CANDIDATE_TOP_K]
+    rows.sort(key=_candidate_order)
+    return rows
+
+def query_candidates(cur, table, select, select_params, probes, wa_ts):
+    """
+    Candidate rows of `table` for one WA item. `probes` are (column, target)
+    pairs; a row qualifies when any probe column is near its target hash.
+    Returns (rows, complete) as search_candidates() does.
+    """
+    if CANDIDATE_TOP_K:
+        return nearest_candidates(cur, table, select, select_params, probes), True
+    where = " OR ".join(f"{column} <@ (%s, %s)" for column, _ in probes)
+    params = list(select_params)
+    for _, target in probes:
+        params += [target, HAMMING_DISTANCE_THRESHOLD]
+    return search_candidates(cur, f"""
+        SELECT {select}
+        FROM {table}
+        WHERE ({where}) {{time_filter}}
+        ORDER BY timestamp ASC, id DESC
+    """, tuple(params), wa_ts)
+
+# ─── WORK LEASES ──────────────────────────────────────────────────────────────
+# Each reviewer session (X-Session-Id) holds a lease on the item it is looking
+# at. /api/match claims the offset-th pending row that nobody else holds, with
+# SELECT … FOR UPDATE SKIP LOCKED so concurrent claims never pick the same row;
+# the page renews the lease while the item is on screen, commit/skip release
+# it, and expired leases are ignored by every query and reaped in the background.
+
+WORK_LEASES   = os.environ.get("WORK_LEASES", "1") == "1"
+LEASE_SECONDS = int(os.environ.get("LEASE_SECONDS", "300"))
+
+WA_ROW_COLUMNS = "id, filename, filetype, hash, video_thumb_hash, ids_hash, thumbnail, timestamp, cluster_id"
+NOT_LEASED_SQL = """NOT EXISTS (SELECT 1 FROM wa_lease l
+                   WHERE l.wa_id = wa.id AND l.holder <> %s AND l.expires_at > now())"""
+
+def session_id():
+    return request.headers.get("X-Session-Id") or None
+
+def lease(cur, holder, wa_id):
+    """Take or renew `holder`'s lease on wa_id; False if someone else holds a live one."""
+    cur.execute("""
+        INSERT INTO wa_lease (wa_id, holder, expires_at)
+        VALUES (%s, %s, now() + make_interval(secs => %s))
+        ON CONFLICT (wa_id) DO UPDATE
+            SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+            WHERE wa_lease.holder = EXCLUDED.holder OR wa_lease.expires_at <= now()
+        RETURNING wa_id
+    """, (wa_id, holder, LEASE_SECONDS))
+    return cur.fetchone() is not None
+
+def lease_holder(cur, wa_id):
+    cur.execute("SELECT holder FROM wa_lease WHERE wa_id = %s AND expires_at > now()", (wa_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def claim_next(cur, holder, offset):
+    """
+    Release `holder`'s lease and lease the offset-th pending row not held by
+    anyone else. Returns the row (WA_ROW_COLUMNS) or None; commits.
+    """
+    cur.execute("DELETE FROM wa_lease WHERE holder = %s", (holder,))
+    for _ in range(3):   # lost a race for an expired lease → next candidate
+        cur.execute(f"""
+            SELECT {WA_ROW_COLUMNS}
+            FROM wa
+            WHERE {PENDING_GROUPS_SQL} AND {NOT_LEASED_SQL}
             ORDER BY timestamp DESC, id ASC
             LIMIT 1 OFFSET %s
-        """, (offset,))
+            FOR UPDATE OF wa SKIP LOCKED
+        """, (holder, offset))
         row = cur.fetchone()
-        if not row:
-            return jsonify({"count": 0, "item": None, "candidates": [], "partner_candidates": []})
-
-        fname = row["filename"] or ""
-        static_media_url = None
-        if fname.startswith("Media"):
-            static_media_url = f"/static/{fname}"
-
-        wa_item = {
-            "id":               row["id"],
-            "filename":         fname,
-            "filetype":         row["filetype"],
-            "timestamp":        row["timestamp"].isoformat() if row["timestamp"] else None,
-            "thumbnail_url":    f"/api/wa-thumbnail/{row['id']}",
-            "has_ids_hash":     row["ids_hash"] is not None,
-            "static_media_url": static_media_url,
-        }
+        if row is None or lease(cur, holder, row["id"]):
+            break
+    cur.connection.commit()
+    return row
 
-        # ── Fetch candidate matches ──────────────────────────────────────────
-        candidates = []
-        if row["ids_hash"] is not None:
-            # Pre-filtered list
-            cur.execute("""
-                SELECT id, filename, hash, video_thumb_hash, camera_name, location,
-                       timestamp, url, preview_url,
-                       origin, size, filesize, thumbnail,
-                       video_thumb_hash <-> %s AS thumb_dist
-                FROM hashes
-                WHERE id = ANY(%s)
-                ORDER BY timestamp ASC, id DESC
-            """, (row["video_thumb_hash"], row["ids_hash"]))
-        else:
-            filetype = row["filetype"] or ""
-            if filetype in ("Video", "video/mp4"):
-                cur.execute("""
-                    SELECT id, filename, hash, video_thumb_hash, camera_name, location,
-                           timestamp, url, preview_url,
-                           origin, size, filesize, thumbnail,
-                           video_thumb_hash <-> %s AS thumb_dist,
-                           hash <-> %s AS thumb_to_hash
-                    FROM hashes
-                    WHERE video_thumb_hash <@ (%s, %s)
-                       OR hash <@ (%s, %s)
-                    ORDER BY timestamp ASC, id DESC
-                """, (
-                    row["video_thumb_hash"], row["video_thumb_hash"],
-                    row["video_thumb_hash"], HAMMING_DISTANCE_THRESHOLD,
-                    row["video_thumb_hash"], HAMMING_DISTANCE_THRESHOLD,
-                ))
-            elif filetype in ("Image", "image/jpeg"):
-                cur.execute("""
-                    SELECT id, filename, hash, video_thumb_hash, camera_name, location,
-                           timestamp, url, preview_url,
-                           origin, size, filesize, thumbnail,
-                           video_thumb_hash <-> %s AS thumb_dist
-                    FROM hashes
-                    WHERE hash <@ (%s, %s)
-                    ORDER BY timestamp ASC, id DESC
-                """, (row["video_thumb_hash"], row["hash"], HAMMING_DISTANCE_THRESHOLD))
-            else:
-                return jsonify({"error": f"Unsupported filetype: {filetype}"}), 400
+def reap_leases():
+    conn = connect_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM wa_lease WHERE expires_at <= now()")
+            n = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return n
 
-        raw_candidates = cur.fetchall()
+def _lease_reaper_loop():
+    while True:
+        time.sleep(max(LEASE_SECONDS // 2, 5))
+        try:
+            reap_leases()
+        except Exception as e:
+            app.logger.error(f"lease reaper error: {e}", exc_info=True)
+
+@app.route("/api/lease", methods=["POST"])
+def api_lease():
+    """Claim/renew the caller's lease on the item on screen. Body: {"wa_id"}; 409 if taken."""
+    holder = session_id()
+    wa_id  = (request.get_json(force=True) or {}).get("wa_id")
+    if not holder or not wa_id:
+        return jsonify({"error": "X-Session-Id and wa_id required"}), 400
+    if not WORK_LEASES:
+        return jsonify({"ok": True, "leases": False})
+    try:
+        conn, cur = get_db()
+        cur.execute("DELETE FROM wa_lease WHERE holder = %s AND wa_id <> %s", (holder, wa_id))
+        ok = lease(cur, holder, wa_id)
+        conn.commit()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if not ok:
+        return jsonify({"error": "Another reviewer is working on this item", "conflict": True}), 409
+    return jsonify({"ok": True, "expires_in": LEASE_SECONDS})
+
+@app.route("/api/lease/release", methods=["POST"])
+def api_lease_release():
+    """Drop the caller's lease (page closed). Accepts {"sid"} in the body for sendBeacon."""
+    holder = session_id() or (request.get_json(force=True, silent=True) or {}).get("sid")
+    if not holder:
+        return jsonify({"error": "sid required"}), 400
+    try:
+        conn, cur = get_db()
+        cur.execute("DELETE FROM wa_lease WHERE holder = %s", (holder,))
+        conn.commit()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"ok": True})
 
-        for c in raw_candidates:
-            cd = {
-                "id":            c["id"],
-                "filename":      c["filename"],
-                "camera_name":   c.get("camera_name"),
-                "location":      c.get("location"),
-                "timestamp":     c["timestamp"].isoformat() if c.get("timestamp") else None,
-                "url":           c.get("url"),
-                "preview_url":   c.get("preview_url"),
-                "thumb_dist":    float(c["thumb_dist"]) if c.get("thumb_dist") is not None else None,
-                "thumb_to_hash": float(c["thumb_to_hash"]) if c.get("thumb_to_hash") is not None else None,
-                "thumbnail_url": f"/api/thumbnail/{c['id']}",
-                "hamming_distance": hamming_distance(row["hash"], c["hash"]),
-                "source":        "hashes",
-                "origin":        c.get("origin"),
-                "size":          c.get("size"),
-                "filesize":      c.get("filesize"),
-                "pixel_dist":    pixel_distance(row["thumbnail"], c.get("thumbnail")),
-            }
-            candidates.append(cd)
-
-        # ── Auto-select logic (faithful to original gphoto-phash-flask) ────────
-        auto_select_id = None
-        filetype = row["filetype"] or ""
-        # wa_ts always timezone-naive for comparisons
-        wa_ts_raw = row["timestamp"]
-        wa_ts = wa_ts_raw.replace(tzinfo=None) if wa_ts_raw else None
-
-        def ts_naive(iso_str):
-            """Parse an ISO timestamp string and strip tzinfo."""
-            if not iso_str:
-                return None
-            return datetime.datetime.fromisoformat(iso_str).replace(tzinfo=None)
-
-        if len(candidates) == 2:
-            if filetype in ("Video", "video/mp4"):
-                # Auto-select first candidate if it has location and second does not
-                if candidates[0].get("location") and not candidates[1].get("location"):
-                    auto_select_id = candidates[0]["id"]
-            elif filetype in ("Image", "image/jpeg"):
-                # Auto-select first candidate if it has camera_name, second does not,
-                # and timestamp is within 60 days of wa item (matching original)
-                h_ts = ts_naive(candidates[0].get("timestamp"))
-                if (
-                    candidates[0].get("camera_name")
-                    and not candidates[1].get("camera_name")
-                    and wa_ts and h_ts
-                    and wa_ts - h_ts < datetime.timedelta(days=60)
-                ):
-                    auto_select_id = candidates[0]["id"]
-
-        elif len(candidates) > 2:
-            if filetype in ("Image", "image/jpeg"):
-                # Filter: has camera_name AND timestamp within 30 days of wa item
-                with_camera = [c for c in candidates if c.get("camera_name")]
-                if wa_ts:
-                    recent = [
-                        c for c in with_camera
-                        if ts_naive(c.get("timestamp")) is not None
-                        and wa_ts - ts_naive(c["timestamp"]) < datetime.timedelta(days=30)
-                    ]
-                    if recent:
-                        # Pick the single candidate with minimum hamming_distance
-                        # Use explicit None check — 0 is a valid (perfect) distance
-                        min_dist = min(
-                            c["hamming_distance"] if c["hamming_distance"] is not None else 999
-                            for c in recent
-                        )
-                        best = [c for c in recent if c["hamming_distance"] == min_dist]
-                        if len(best) == 1:
-                            auto_select_id = best[0]["id"]
-
-            elif filetype in ("Video", "video/mp4"):
-                # Filter: has location AND timestamp within 30 days of wa item
-                with_location = [c for c in candidates if c.get("location")]
-                if wa_ts:
-                    recent = [
-                        c for c in with_location
-                        if ts_naive(c.get("timestamp")) is not None
-                        and wa_ts - ts_naive(c["timestamp"]) < datetime.timedelta(days=30)
-                    ]
-                    if recent:
-                        # Pick the single candidate with minimum thumb_dist (perceptual hash dist)
-                        min_dist = min(
-                            c["thumb_dist"] if c["thumb_dist"] is not None else 999
-                            for c in recent
-                        )
-                        best = [c for c in recent if c["thumb_dist"] == min_dist]
-                        if len(best) == 1:
-                            auto_select_id = best[0]["id"]
-
-        # ── Pixel-distance fallback ─────────────────────────────────────────────
-        # If no auto-select was found and thumbnails are available, pick the
-        # single hashes candidate with the lowest pixel distance as a suggestion.
-        if auto_select_id is None and candidates:
-            scored = [c for c in candidates if c.get("pixel_dist") is not None]
-            if scored:
-                best_px = min(scored, key=lambda c: c["pixel_dist"])
-                # Only auto-select if it's meaningfully better than the rest
-                others = [c for c in scored if c["id"] != best_px["id"]]
-                if not others or best_px["pixel_dist"] < min(c["pixel_dist"] for c in others) - 2:
-                    auto_select_id = best_px["id"]
-
-        # ── Partner candidates ───────────────────────────────────────────────
-        partner_candidates = []
+# ─── MATCH API ────────────────────────────────────────────────────────────────
+
+def find_candidates(cur, row):
+    """
+    Candidate search + auto-select for one `wa` row.
+    Returns {"candidates", "partner_candidates", "auto_select_id"}; this is the
+    expensive part of /api/match and what the match cache stores.
+    """
+    # ── Fetch candidate matches ──────────────────────────────────────────
+    candidates = []
+    complete = True   # False if a time-sharded search stopped early
+    if row["ids_hash"] is not None:
+        # Pre-filtered list
+        cur.execute(f"""
+            SELECT {HASHES_COLUMNS},
+                   video_thumb_hash <-> %s AS thumb_dist
+            FROM hashes
+            WHERE id = ANY(%s)
+            ORDER BY timestamp ASC, id DESC
+        """, (row["video_thumb_hash"], row["ids_hash"]))
+        raw_candidates = cur.fetchall()
+    else:
         filetype = row["filetype"] or ""
-        try:
-            if filetype in ("Video", "video/mp4"):
-                cur.execute("""
-                    SELECT id, filename, camera_name, location, timestamp, url, hash,
-                           size, filesize, thumbnail,
-                           video_thumb_hash <-> %s AS thumb_dist,
-                           hash <-> %s AS thumb_to_hash
-                    FROM partner
-                    WHERE video_thumb_hash <@ (%s, %s)
-                       OR hash <@ (%s, %s)
-                    ORDER BY timestamp ASC, id DESC
-                """, (
-                    row["video_thumb_hash"], row["video_thumb_hash"],
-                    row["video_thumb_hash"], HAMMING_DISTANCE_THRESHOLD,
-                    row["video_thumb_hash"], HAMMING_DISTANCE_THRESHOLD,
-                ))
-            elif filetype in ("Image", "image/jpeg"):
-                cur.execute("""
-                    SELECT id, filename, camera_name, location, timestamp, url, hash,
-                           size, filesize, thumbnail,
-                           video_thumb_hash <-> %s AS thumb_dist
-                    FROM partner
-                    WHERE hash <@ (%s, %s)
-                    ORDER BY timestamp ASC, id DESC
-                """, (row["video_thumb_hash"], row["hash"], HAMMING_DISTANCE_THRESHOLD))
-            partner_raw = cur.fetchall()
-            for p in partner_raw:
-                partner_candidates.append({
-                    "id":            p["id"],
-                    "filename":      p["filename"],
-                    "camera_name":   p.get("camera_name"),
-                    "location":      p.get("location"),
-                    "timestamp":     p["timestamp"].isoformat() if p.get("timestamp") else None,
-                    "url":           p.get("url"),
-                    "thumb_dist":    float(p["thumb_dist"]) if p.get("thumb_dist") is not None else None,
-                    "thumb_to_hash": float(p["thumb_to_hash"]) if p.get("thumb_to_hash") is not None else None,
-                    "thumbnail_url": f"/api/partner-thumbnail/{p['id']}",
-                    "source":        "partner",
-                    "origin":        None,
-                    "size":          p.get("size"),
-                    "filesize":      p.get("filesize"),
-                    "hamming_distance": hamming_distance(row["hash"], p.get("hash")),
-                    "preview_url":   p.get("preview_url"),
-                    "pixel_dist":    pixel_distance(row["thumbnail"], p.get("thumbnail")),
-                })
-        except Exception:
-            pass  # partner table may not exist
+        vt = row["video_thumb_hash"]
+        if filetype in ("Video", "video/mp4"):
+            raw_candidates, complete = query_candidates(
+                cur, "hashes",
+                f"{HASHES_COLUMNS}, video_thumb_hash <-> %s AS thumb_dist, hash <-> %s AS thumb_to_hash",
+                (vt, vt), [("video_thumb_hash", vt), ("hash", vt)], row["timestamp"])
+        elif filetype in ("Image", "image/jpeg"):
+            raw_candidates, complete = query_candidates(
+                cur, "hashes", f"{HASHES_COLUMNS}, video_thumb_hash <-> %s AS thumb_dist",
+                (vt,), [("hash", row["hash"])], row["timestamp"])
+        else:
+            raise ValueError(f"Unsupported filetype: {filetype}")
+
+    for c in raw_candidates:
+        cd = {
+            "id":            c["id"],
+            "filename":      c["filename"],
+            "camera_name":   c.get("camera_name"),
+            "location":      c.get("location"),
+            "timestamp":     c["timestamp"].isoformat() if c.get("timestamp") else None,
+            "url":           c.get("url"),
+            "preview_url":   c.get("preview_url"),
+            "thumb_dist":    float(c["thumb_dist"]) if c.get("thumb_dist") is not None else None,
+            "thumb_to_hash": float(c["thumb_to_hash"]) if c.get("thumb_to_hash") is not None else None,
+            "thumbnail_url": f"/api/thumbnail/{c['id']}",
+            "hamming_distance": hamming_distance(row["hash"], c["hash"]),
+            "source":        "hashes",
+            "origin":        c.get("origin"),
+            "size":          c.get("size"),
+            "filesize":      c.get("filesize"),
+            "pixel_dist":    pixel_distance(row["thumbnail"], c.get("thumbnail")),
+        }
+        candidates.append(cd)
+
+    # ── Auto-select logic (faithful to original gphoto-phash-flask) ────────
+    auto_select_id = None
+    # The rules assume they see every competing match. A time-sharded search
+    # that stopped at the first window with a hit may have hidden older
+    # originals, so it only lists candidates and never pre-selects one.
+    pool = candidates if complete else []
+    # Top-K returns the K nearest rows however far away they are; only those
+    # radius mode would also have returned may be pre-selected.
+    if CANDIDATE_TOP_K:
+        pool = [cd for cd, c in zip(pool, raw_candidates)
+                if c.get("nn_dist") is None or c["nn_dist"] <= HAMMING_DISTANCE_THRESHOLD]
+    filetype = row["filetype"] or ""
+    # Compare native datetimes (timezone-naive) straight from the rows
+    wa_ts_raw = row["timestamp"]
+    wa_ts = wa_ts_raw.replace(tzinfo=None) if wa_ts_raw else None
+    cand_ts = {
+        c["id"]: c["timestamp"].replace(tzinfo=None) if c.get("timestamp") else None
+        for c in raw_candidates
+    }
+
+    if len(pool) == 2:
+        if filetype in ("Video", "video/mp4"):
+            # Auto-select first candidate if it has location and second does not
+            if pool[0].get("location") and not pool[1].get("location"):
+                auto_select_id = pool[0]["id"]
+        elif filetype in ("Image", "image/jpeg"):
+            # Auto-select first candidate if it has camera_name, second does not,
+            # and timestamp is within 60 days of wa item (matching original)
+            h_ts = cand_ts[pool[0]["id"]]
+            if (
+                pool[0].get("camera_name")
+                and not pool[1].get("camera_name")
+                and wa_ts and h_ts
+                and wa_ts - h_ts < datetime.timedelta(days=60)
+            ):
+                auto_select_id = pool[0]["id"]
+
+    elif len(pool) > 2:
+        if filetype in ("Image", "image/jpeg"):
+            # Filter: has camera_name AND timestamp within 30 days of wa item
+            with_camera = [c for c in pool if c.get("camera_name")]
+            if wa_ts:
+                recent = [
+                    c for c in with_camera
+                    if cand_ts[c["id"]] is not None
+                    and wa_ts - cand_ts[c["id"]] < datetime.timedelta(days=30)
+                ]
+                if recent:
+                    # Pick the single candidate with minimum hamming_distance
+                    # Use explicit None check — 0 is a valid (perfect) distance
+                    min_dist = min(
+                        c["hamming_distance"] if c["hamming_distance"] is not None else 999
+                        for c in recent
+                    )
+                    best = [c for c in recent if c["hamming_distance"] == min_dist]
+                    if len(best) == 1:
+                        auto_select_id = best[0]["id"]
+
+        elif filetype in ("Video", "video/mp4"):
+            # Filter: has location AND timestamp within 30 days of wa item
+            with_location = [c for c in pool if c.get("location")]
+            if wa_ts:
+                recent = [
+                    c for c in with_location
+                    if cand_ts[c["id"]] is not None
+                    and wa_ts - cand_ts[c["id"]] < datetime.timedelta(days=30)
+                ]
+                if recent:
+                    # Pick the single candidate with minimum thumb_dist (perceptual hash dist)
+                    min_dist = min(
+                        c["thumb_dist"] if c["thumb_dist"] is not None else 999
+                        for c in recent
+                    )
+                    best = [c for c in recent if c["thumb_dist"] == min_dist]
+                    if len(best) == 1:
+                        auto_select_id = best[0]["id"]
+
+    # ── Pixel-distance fallback ─────────────────────────────────────────────
+    # If no auto-select was found and thumbnails are available, pick the
+    # single hashes candidate with the lowest pixel distance as a suggestion.
+    if auto_select_id is None and pool:
+        scored = [c for c in pool if c.get("pixel_dist") is not None]
+        if scored:
+            best_px = min(scored, key=lambda c: c["pixel_dist"])
+            # Only auto-select if it's meaningfully better than the rest
+            others = [c for c in scored if c["id"] != best_px["id"]]
+            if not others or best_px["pixel_dist"] < min(c["pixel_dist"] for c in others) - 2:
+                auto_select_id = best_px["id"]
+
+    # ── Partner candidates ───────────────────────────────────────────────
+    partner_candidates = []
+    filetype = row["filetype"] or ""
+    # Savepoint so a failure here doesn't abort the caller's transaction
+    cur.execute("SAVEPOINT partner_candidates")
+    try:
+        partner_raw = []
+        vt = row["video_thumb_hash"]
+        if filetype in ("Video", "video/mp4"):
+            partner_raw, _ = query_candidates(
+                cur, "partner",
+                f"{PARTNER_COLUMNS}, video_thumb_hash <-> %s AS thumb_dist, hash <-> %s AS thumb_to_hash",
+                (vt, vt), [("video_thumb_hash", vt), ("hash", vt)], row["timestamp"])
+        elif filetype in ("Image", "image/jpeg"):
+            partner_raw, _ = query_candidates(
+                cur, "partner", f"{PARTNER_COLUMNS}, video_thumb_hash <-> %s AS thumb_dist",
+                (vt,), [("hash", row["hash"])], row["timestamp"])
+        for p in partner_raw:
+            partner_candidates.append({
+                "id":            p["id"],
+                "filename":      p["filename"],
+                "camera_name":   p.get("camera_name"),
+                "location":      p.get("location"),
+                "timestamp":     p["timestamp"].isoformat() if p.get("timestamp") else None,
+                "url":           p.get("url"),
+                "thumb_dist":    float(p["thumb_dist"]) if p.get("thumb_dist") is not None else None,
+                "thumb_to_hash": float(p["thumb_to_hash"]) if p.get("thumb_to_hash") is not None else None,
+                "thumbnail_url": f"/api/partner-thumbnail/{p['id']}",
+                "source":        "partner",
+                "origin":        None,
+                "size":          p.get("size"),
+                "filesize":      p.get("filesize"),
+                "hamming_distance": hamming_distance(row["hash"], p.get("hash")),
+                "preview_url":   p.get("preview_url"),
+                "pixel_dist":    pixel_distance(row["thumbnail"], p.get("thumbnail")),
+            })
+        cur.execute("RELEASE SAVEPOINT partner_candidates")
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT partner_candidates")  # partner table may not exist
 
-        return jsonify({
-            "count":              count,
-            "offset":             offset,
-            "item":               wa_item,
-            "candidates":         candidates,
-            "partner_candidates": partner_candidates,
-            "auto_select_id":     auto_select_id,
-            "has_undo":           _last_commit["wa_id"] is not None,
-        })
+    return {
+        "candidates":         candidates,
+        "partner_candidates": partner_candidates,
+        "auto_select_id":     auto_select_id,
+    }
 
+def build_match(cur, offset, holder=None, claim=False):
+    """
+    The /api/match payload for queue position `offset`: remaining count, the
+    WA item and its (cached) candidates. Raises ValueError for unsupported filetypes.
+    With a `holder` (and WORK_LEASES) rows leased by other sessions are skipped;
+    `claim` also leases the row to `holder`.
+    """
+    # Count remaining
+    cur.execute(f"SELECT count(*) FROM wa WHERE {PENDING_GROUPS_SQL}")
+    count = cur.fetchone()[0]
+
+    if not count:
+        return {"count": 0, "offset": offset, "item": None, "candidates": [], "partner_candidates": []}
+
+    # Fetch the item
+    if holder and WORK_LEASES and claim:
+        row = claim_next(cur, holder, offset)
+    else:
+        cur.execute(f"""
+            SELECT {WA_ROW_COLUMNS}
+            FROM wa
+            WHERE {PENDING_GROUPS_SQL} AND {NOT_LEASED_SQL if holder and WORK_LEASES else "TRUE"}
+            ORDER BY timestamp DESC, id ASC
+            LIMIT 1 OFFSET %s
+        """, (holder, offset) if holder and WORK_LEASES else (offset,))
+        row = cur.fetchone()
+    if not row:
+        return {"count": 0, "offset": offset, "item": None, "candidates": [], "partner_candidates": []}
+
+    payload = match_payload(cur, row)
+    return {
+        "count":              count,
+        "offset":             offset,
+        "item":               wa_item(cur, row),
+        "candidates":         payload["candidates"],
+        "partner_candidates": payload["partner_candidates"],
+        "auto_select_id":     payload["auto_select_id"],
+        "has_undo":           last_commit(holder) is not None,
+    }
+
+def wa_item(cur, row):
+    """Client-facing dict for a pending `wa` row (needs id, filename, filetype, ids_hash, timestamp, cluster_id)."""
+    fname = row["filename"] or ""
+    static_media_url = media_url = preview_url = None
+    if fname.startswith("Media"):
+        static_media_url = f"/static/{fname}"
+        media_url   = f"/api/media/{quote(fname)}"
+        preview_url = f"/api/media-preview/{quote(fname)}"
+
+    item = {
+        "id":               row["id"],
+        "filename":         fname,
+        "filetype":         row["filetype"],
+        "timestamp":        row["timestamp"].isoformat() if row["timestamp"] else None,
+        "thumbnail_url":    f"/api/wa-thumbnail/{row['id']}",
+        "has_ids_hash":     row["ids_hash"] is not None,
+        "static_media_url": static_media_url,
+        "media_url":        media_url,
+        "preview_url":      preview_url,
+        "cluster_size":     1,
+    }
+    if row["cluster_id"] is not None:
+        cur.execute(
+            "SELECT count(*) FROM wa WHERE cluster_id = %s AND id_hash IS NULL AND processed IS NULL",
+            (row["cluster_id"],))
+        item["cluster_size"] = max(1, cur.fetchone()[0])
+    return item
+
+def match_payload(cur, row):
+    """Candidates for a `wa` row, through the match cache."""
+    payload = match_cache_get(row["id"])
+    if payload is None:
+        payload = find_candidates(cur, row)
+        match_cache_put(row["id"], payload)
+    return payload
+
+@app.route("/api/match")
+@app.route("/api/match/<int:offset>")
+def api_match(offset=0):
+    """
+    Return the next unmatched WA item and its candidate matches from hashes table.
+    Candidate payloads come from the match cache (dropped on commit/skip/undo).
+    The item is leased to the caller's X-Session-Id (see WORK LEASES).
+    """
+    try:
+        conn, cur = get_db()
+        # ?peek=1 (prefetch) skips other sessions' items without taking a lease
+        return jsonify(build_match(cur, offset, session_id(), claim=not request.args.get("peek")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         app.logger.error(f"match error: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
+def apply_decision(cur, wa_id, hash_id=None, skip=False):
+    """
+    Record a match (or a skip) for `wa_id` and the rest of its near-duplicate
+    group. Returns (previous {id_hash, cluster_id} row, other member ids).
+    """
+    cur.execute("SELECT id_hash, cluster_id FROM wa WHERE id = %s", (wa_id,))
+    prev_row = cur.fetchone()
+    cluster_id = prev_row["cluster_id"] if prev_row else None
+    if skip:
+        member_ids = update_cluster(cur, cluster_id, wa_id, "processed = TRUE")
+    else:
+        member_ids = update_cluster(cur, cluster_id, wa_id, "id_hash = %s", (hash_id,))
+    cur.execute("DELETE FROM wa_lease WHERE wa_id = %s", (wa_id,))
+    return prev_row, member_ids
+
 @app.route("/api/match/commit", methods=["POST"])
 def api_commit():
     """Commit a hash match (or un-match) for a WA item."""
@@ -579,24 +1611,30 @@ def api_commit():
     if not wa_id:
         return jsonify({"error": "wa_id required"}), 400
 
+    holder = session_id()
     try:
         conn, cur = get_db()
-        # Save previous state for undo
-        cur.execute("SELECT id_hash FROM wa WHERE id = %s", (wa_id,))
-        prev_row = cur.fetchone()
-        _last_commit["wa_id"]        = wa_id
-        _last_commit["prev_id_hash"] = prev_row["id_hash"] if prev_row else None
+        if WORK_LEASES and lease_holder(cur, wa_id) not in (None, holder):
+            return jsonify({"error": "Another reviewer is working on this item", "conflict": True}), 409
         if rematch:
+            # Save previous state for undo
+            cur.execute("SELECT id_hash, cluster_id FROM wa WHERE id = %s", (wa_id,))
+            prev_row = cur.fetchone()
+            member_ids = []
             cur.execute("UPDATE wa SET ids_hash = NULL WHERE id = %s", (wa_id,))
         else:
-            cur.execute("UPDATE wa SET id_hash = %s WHERE id = %s", (hash_id, wa_id))
+            # One decision resolves the whole near-duplicate group
+            prev_row, member_ids = apply_decision(cur, wa_id, hash_id)
         conn.commit()
+        remember_commit(holder, wa_id, prev_row["id_hash"] if prev_row else None, member_ids)
+        match_cache_drop(wa_id, *member_ids)
+        publish("invalidate", {"wa_ids": [wa_id, *member_ids], "by": holder})
         # Bust thumbnail cache entry
         for p in [f"wa_{wa_id}.jpg"]:
             cp = os.path.join(THUMB_CACHE_DIR, p)
             if os.path.exists(cp):
                 os.remove(cp)
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "updated": 1 + len(member_ids)})
     except Exception as e:
         app.logger.error(f"commit error: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -604,19 +1642,24 @@ def api_commit():
 
 @app.route("/api/match/undo", methods=["POST"])
 def api_undo():
-    """Undo the most recent commit by restoring the previous id_hash value."""
-    wa_id = _last_commit.get("wa_id")
-    if not wa_id:
+    """Undo this session's most recent commit by restoring the previous id_hash value."""
+    holder = session_id()
+    last = last_commit(holder)
+    if not last:
         return jsonify({"error": "Nothing to undo"}), 400
+    wa_id = last["wa_id"]
     try:
         conn, cur = get_db()
-        prev = _last_commit["prev_id_hash"]
-        cur.execute("UPDATE wa SET id_hash = %s WHERE id = %s", (prev, wa_id))
+        prev = last["prev_id_hash"]
+        member_ids = last.get("member_ids") or []
+        cur.execute("UPDATE wa SET id_hash = %s, decided_at = now() WHERE id = %s", (prev, wa_id))
+        if member_ids:
+            cur.execute("UPDATE wa SET id_hash = NULL, decided_at = now() WHERE id = ANY(%s)", (member_ids,))
         conn.commit()
-        undone_wa_id = wa_id
-        _last_commit["wa_id"]        = None
-        _last_commit["prev_id_hash"] = None
-        return jsonify({"ok": True, "undone_wa_id": undone_wa_id, "restored_id_hash": prev})
+        match_cache_drop(wa_id, *member_ids)
+        publish("invalidate", {"wa_ids": [wa_id, *member_ids], "by": holder})
+        forget_commit(holder)
+        return jsonify({"ok": True, "undone_wa_id": wa_id, "restored_id_hash": prev})
     except Exception as e:
         app.logger.error(f"undo error: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -628,13 +1671,369 @@ def api_skip():
     wa_id = data.get("wa_id")
     if not wa_id:
         return jsonify({"error": "wa_id required"}), 400
+    holder = session_id()
+    try:
+        conn, cur = get_db()
+        if WORK_LEASES and lease_holder(cur, wa_id) not in (None, holder):
+            return jsonify({"error": "Another reviewer is working on this item", "conflict": True}), 409
+        _, member_ids = apply_decision(cur, wa_id, skip=True)
+        conn.commit()
+        match_cache_drop(wa_id, *member_ids)
+        publish("invalidate", {"wa_ids": [wa_id, *member_ids], "by": holder})
+        return jsonify({"ok": True, "updated": 1 + len(member_ids)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ─── EXPORT (streaming audit of decisions) ────────────────────────────────────
+
+EXPORT_FIELDS = [
+    "wa_id", "filename", "filetype", "timestamp", "status", "id_hash", "processed",
+    "decided_at", "hash_filename", "hash_camera_name", "hash_location",
+    "hash_timestamp", "hash_url", "hash_origin",
+]
+
+def iter_decisions(conn, since=None, status="all", batch_size=2000):
+    """
+    Yield one dict per `wa` row, joined to the chosen `hashes` row.
+    Uses a server-side (named) cursor so memory stays flat however big `wa` is.
+    `since` filters on wa.decided_at; `status` is all | decided | pending.
+    """
+    where = []
+    params = []
+    if since is not None:
+        where.append("wa.decided_at >= %s")
+        params.append(since)
+    if status == "decided":
+        where.append("(wa.id_hash IS NOT NULL OR wa.processed IS NOT NULL)")
+    elif status == "pending":
+        where.append("wa.id_hash IS NULL AND wa.processed IS NULL")
+    sql = """
+        SELECT wa.id AS wa_id, wa.filename, wa.filetype, wa.timestamp,
+               wa.id_hash, wa.processed, wa.decided_at,
+               h.filename AS hash_filename, h.camera_name AS hash_camera_name,
+               h.location AS hash_location, h.timestamp AS hash_timestamp,
+               h.url AS hash_url, h.origin AS hash_origin
+        FROM wa
+        LEFT JOIN hashes h ON h.id = wa.id_hash
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY wa.id"
+
+    import psycopg2.extras
+    cur = conn.cursor(name="export_decisions", cursor_factory=psycopg2.extras.DictCursor)
+    cur.itersize = batch_size
+    try:
+        cur.execute(sql, params)
+        for r in cur:
+            d = row_to_dict(r)
+            if d["id_hash"] is not None:
+                d["status"] = "matched"
+            elif d["processed"] is not None:
+                d["status"] = "skipped"
+            else:
+                d["status"] = "pending"
+            yield d
+    finally:
+        cur.close()
+        conn.rollback()  # end the read-only transaction holding the cursor
+
+def format_decisions(rows, fmt="ndjson"):
+    """Turn decision dicts into NDJSON lines or CSV lines (header first)."""
+    if fmt == "csv":
+        import csv, io
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for d in rows:
+            writer.writerow(d)
+            if buf.tell() > 64 * 1024:
+                yield buf.getvalue()
+                buf.seek(0); buf.truncate()
+        yield buf.getvalue()
+    else:
+        for d in rows:
+            yield json.dumps({k: d.get(k) for k in EXPORT_FIELDS}, default=str) + "\n"
+
+def parse_since(value):
+    """Parse an ISO timestamp (naive values are taken as UTC); None passes through."""
+    if not value:
+        return None
+    ts = datetime.datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts
+
+@app.route("/api/export")
+def api_export():
+    """
+    Stream match decisions as NDJSON (default) or CSV.
+    Query params: format=ndjson|csv, since=<ISO timestamp>, status=all|decided|pending
+    """
+    from flask import Response, stream_with_context
+    fmt    = request.args.get("format", "ndjson")
+    status = request.args.get("status", "all")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    if status not in ("all", "decided", "pending"):
+        return jsonify({"error": f"Unsupported status: {status}"}), 400
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError:
+        return jsonify({"error": "since must be an ISO timestamp"}), 400
+
+    try:
+        conn = connect_db()
+    except Exception as e:
+        app.logger.error(f"export error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        try:
+            yield from format_decisions(iter_decisions(conn, since, status), fmt)
+        finally:
+            conn.close()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=decisions.{fmt}"},
+    )
+
+# ─── OFFLINE REVIEW (bundle + deferred sync) ──────────────────────────────────
+# The PWA downloads the next N queue items with candidates and thumbnails in
+# one gzip'd bundle, stores it in IndexedDB and records decisions offline.
+# Each item carries `base` (its decided_at when bundled); on sync a decision
+# is only applied if the row is still pending with the same decided_at.
+
+OFFLINE_BUNDLE_FORMAT  = 1
+OFFLINE_BUNDLE_MAX     = 500
+OFFLINE_MAX_CANDIDATES = int(os.environ.get("OFFLINE_MAX_CANDIDATES", "8"))
+
+def build_offline_bundle(cur, limit, holder=None):
+    cur.execute(f"SELECT count(*) FROM wa WHERE {PENDING_GROUPS_SQL}")
+    count = cur.fetchone()[0]
+    cur.execute("""
+        SELECT {WA_ROW_COLUMNS}, decided_at
+        FROM wa
+        WHERE {PENDING_GROUPS_SQL} AND {NOT_LEASED_SQL}
+        ORDER BY timestamp DESC, id ASC
+        LIMIT %s
+    """.format(WA_ROW_COLUMNS=WA_ROW_COLUMNS, PENDING_GROUPS_SQL=PENDING_GROUPS_SQL,
+               NOT_LEASED_SQL=NOT_LEASED_SQL), (holder or "", limit))
+    rows = cur.fetchall()
+
+    items, thumbs = [], {}
+    hash_ids, partner_ids = set(), set()
+    for row in rows:
+        try:
+            payload = match_payload(cur, row)
+        except ValueError:
+            continue   # unsupported filetype — reviewable online only
+        item = wa_item(cur, row)
+        item["base"] = row["decided_at"].isoformat() if row["decided_at"] else None
+        thumbs[item["thumbnail_url"]] = thumbnail_b64(row["thumbnail"])
+        candidates = payload["candidates"][:OFFLINE_MAX_CANDIDATES]
+        partners   = payload["partner_candidates"][:OFFLINE_MAX_CANDIDATES]
+        hash_ids.update(c["id"] for c in candidates)
+        partner_ids.update(p["id"] for p in partners)
+        items.append({
+            "item":               item,
+            "candidates":         candidates,
+            "partner_candidates": partners,
+            "auto_select_id":     payload["auto_select_id"],
+        })
+
+    for table, ids, prefix in (("hashes", hash_ids, "/api/thumbnail/"),
+                               ("partner", partner_ids, "/api/partner-thumbnail/")):
+        if ids:
+            cur.execute(f"SELECT id, thumbnail FROM {table} WHERE id = ANY(%s)", (list(ids),))
+            for r in cur.fetchall():
+                thumbs[f"{prefix}{r['id']}"] = thumbnail_b64(r["thumbnail"])
+
+    return {
+        "format":     OFFLINE_BUNDLE_FORMAT,
+        "version":    APP_VERSION,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "count":      count,
+        "items":      items,
+        "thumbs":     {url: b64 for url, b64 in thumbs.items() if b64},   # url → base64 JPEG
+    }
+
+@app.route("/api/offline/bundle")
+def api_offline_bundle():
+    """
+    Queue snapshot for offline review.
+    Query params: n=<items, default 50, max OFFLINE_BUNDLE_MAX>
+    """
+    import gzip
+    from flask import Response
+    limit = min(max(request.args.get("n", 50, type=int), 1), OFFLINE_BUNDLE_MAX)
     try:
         conn, cur = get_db()
-        cur.execute("UPDATE wa SET processed = TRUE WHERE id = %s", (wa_id,))
+        body = json.dumps(build_offline_bundle(cur, limit, session_id()), separators=(",", ":"), default=str).encode()
+    except Exception as e:
+        app.logger.error(f"offline bundle error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    headers = {"Cache-Control": "no-store"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.route("/api/offline/sync", methods=["POST"])
+def api_offline_sync():
+    """
+    Replay decisions made offline, oldest first.
+    Body: {"decisions": [{"wa_id", "hash_id", "skip", "base"}, ...]}
+    Rows decided (or re-decided) on the server since the bundle was taken are
+    returned as conflicts and left untouched. Rows leased by another session are
+    still pending; they come back as "leased" conflicts and the client retries them.
+    """
+    data = request.get_json(force=True)
+    decisions = data.get("decisions") or []
+    applied, conflicts, touched = [], [], []
+    try:
+        conn, cur = get_db()
+        for d in decisions:
+            wa_id = d.get("wa_id")
+            cur.execute("SELECT id_hash, processed, decided_at FROM wa WHERE id = %s FOR UPDATE", (wa_id,))
+            row = cur.fetchone()
+            if row is None:
+                conflicts.append({"wa_id": wa_id, "reason": "missing"})
+                continue
+            current = row["decided_at"].isoformat() if row["decided_at"] else None
+            if WORK_LEASES and lease_holder(cur, wa_id) not in (None, session_id()):
+                conflicts.append({"wa_id": wa_id, "reason": "leased"})
+                continue
+            if row["id_hash"] is not None or row["processed"] is not None or current != d.get("base"):
+                conflicts.append({
+                    "wa_id":      wa_id,
+                    "reason":     "changed",
+                    "id_hash":    row["id_hash"],
+                    "processed":  row["processed"],
+                    "decided_at": current,
+                })
+                continue
+            _, member_ids = apply_decision(cur, wa_id, d.get("hash_id"), skip=bool(d.get("skip")))
+            applied.append({"wa_id": wa_id, "updated": 1 + len(member_ids)})
+            touched += [wa_id, *member_ids]
         conn.commit()
-        return jsonify({"ok": True})
     except Exception as e:
+        app.logger.error(f"offline sync error: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
+    if touched:
+        match_cache_drop(*touched)
+        publish("invalidate", {"wa_ids": touched, "by": request.headers.get("X-Session-Id")})
+    return jsonify({"ok": True, "applied": applied, "conflicts": conflicts})
+
+# ─── LIVE EVENTS (SSE) ────────────────────────────────────────────────────────
+# One EventSource per review session. The stream pushes ready-to-render
+# /api/match payloads for the next SSE_AHEAD queue positions, and recomputes
+# them when any session commits/skips/undoes. Streams idle on an in-memory
+# queue and borrow a pooled DB connection only while computing.
+
+SSE_AHEAD     = int(os.environ.get("SSE_AHEAD", "3"))
+SSE_KEEPALIVE = 15   # seconds between comment pings on an idle stream
+
+_sessions = {}   # session id → queue.Queue of (event, data)
+_sessions_lock = threading.Lock()
+
+def publish(event, data, sid=None):
+    """Queue an event for one session, or for every open stream."""
+    with _sessions_lock:
+        targets = [_sessions[sid]] if sid in _sessions else ([] if sid else list(_sessions.values()))
+    for q in targets:
+        q.put((event, data))
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route("/api/events")
+def api_events():
+    """
+    Server-sent events for one review session.
+    Query params: sid=<session id>, offset=<current queue position>
+    Events: hello, item (an /api/match payload), invalidate, reconnect
+    """
+    from flask import Response, stream_with_context
+    sid    = request.args.get("sid") or os.urandom(8).hex()
+    offset = max(0, request.args.get("offset", 0, type=int))
+    q = queue.Queue()
+    with _sessions_lock:
+        _sessions[sid] = q
+
+    def generate():
+        nonlocal offset
+        sent = {}                 # offset → wa id already pushed
+        dirty = True
+        last_sent = time.monotonic()
+        try:
+            yield "retry: 3000\n\n"
+            yield sse("hello", {"sid": sid, "version": APP_VERSION})
+            while not _draining:
+                if dirty:
+                    dirty = False
+                    for off in range(offset, offset + SSE_AHEAD):
+                        if off in sent:
+                            continue
+                        try:
+                            with pooled_db() as (conn, cur):
+                                data = build_match(cur, off, sid)
+                        except Exception as e:
+                            app.logger.error(f"events error: {e}", exc_info=True)
+                            break
+                        sent[off] = (data["item"] or {}).get("id")
+                        yield sse("item", data)
+                        last_sent = time.monotonic()
+                        if data["item"] is None:
+                            break
+                        if not q.empty():
+                            dirty = True   # a newer position/invalidation is waiting
+                            break
+                try:
+                    event, data = q.get(timeout=1)
+                except queue.Empty:
+                    if time.monotonic() - last_sent > SSE_KEEPALIVE:
+                        yield ": keepalive\n\n"
+                        last_sent = time.monotonic()
+                    continue
+                if event == "position":
+                    offset = data["offset"]
+                    sent = {k: v for k, v in sent.items() if offset <= k < offset + SSE_AHEAD}
+                elif event == "invalidate":
+                    yield sse("invalidate", data)
+                    sent.clear()
+                last_sent = time.monotonic()
+                dirty = True
+            # Hot restart: ask the client to reconnect to the new process
+            yield sse("reconnect", {})
+        finally:
+            with _sessions_lock:
+                if _sessions.get(sid) is q:
+                    del _sessions[sid]
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/events/position", methods=["POST"])
+def api_events_position():
+    """Tell a session's stream which queue position the reviewer is on."""
+    data   = request.get_json(force=True)
+    sid    = data.get("sid")
+    offset = data.get("offset")
+    if not sid or not isinstance(offset, int) or offset < 0:
+        return jsonify({"error": "sid and offset required"}), 400
+    with _sessions_lock:
+        live = sid in _sessions
+    if live:
+        publish("position", {"offset": offset}, sid=sid)
+    return jsonify({"ok": True, "live": live})
 
 # ─── FETCH A-SHELL DEPLOY SCRIPT ──────────────────────────────────────────────
 
@@ -682,12 +2081,88 @@ def index():
     return render_template("index.html", version=APP_VERSION)
 
 @app.route("/health")
-@cache.cached(timeout=5)
+@cached(timeout=5)
 def health():
     return jsonify({"ok": True, "version": APP_VERSION})
 
+# ─── REQUEST RECORDING (load-test replay) ──────────────────────────────────────
+# With REQUEST_LOG=<path> every request is appended as one NDJSON line, grouped
+# by the page's X-Session-Id, for `scripts/load_test.py --replay`.
+
+REQUEST_LOG = os.environ.get("REQUEST_LOG", "")
+_request_log_lock = threading.Lock()
+
+@app.after_request
+def record_request(response):
+    if REQUEST_LOG and request.path != "/api/events":
+        line = json.dumps({
+            "t":      round(time.time(), 3),
+            "sid":    request.headers.get("X-Session-Id"),
+            "method": request.method,
+            "path":   request.full_path.rstrip("?"),
+            "body":   request.get_json(silent=True) if request.method == "POST" else None,
+            "status": response.status_code,
+        })
+        with _request_log_lock, open(REQUEST_LOG, "a") as f:
+            f.write(line + "\n")
+    return response
+
 # ─── MAIN ─────────────────────────────────────────────────────────────────────
 
+def _warm_imports():
+    """Load the deferred modules in the background once the socket is bound."""
+    get_cache()
+    _pil()
+    try:
+        import psycopg2.extras  # noqa: F401
+    except ImportError:
+        pass
+
+def warm_up():
+    """Imports, templates and the warm-state snapshot; a hot restart runs this before taking over."""
+    _warm_imports()
+    app.jinja_env.get_template("index.html")
+    restore_warm_state()
+    if WORK_LEASES:
+        threading.Thread(target=_lease_reaper_loop, daemon=True).start()
+
+def _on_sigterm(*_):
+    try:
+        save_snapshot()
+    except Exception as e:
+        app.logger.error(f"snapshot on shutdown failed: {e}", exc_info=True)
+    sys.exit(0)
+
+def serve(host, port, ssl_ctx):
+    """Run the threaded server, on an inherited socket if we are a hot restart."""
+    from werkzeug.serving import make_server
+    global _server
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    ready_fd  = os.environ.pop(READY_FD_ENV, None)
+    if inherited:
+        warm_up()
+    _server = make_server(host, port, app, threaded=True, ssl_context=ssl_ctx,
+                          fd=int(inherited) if inherited else None)
+    if inherited:
+        os.close(int(inherited))   # make_server dup'd it
+    if ready_fd:
+        os.write(int(ready_fd), b"1")
+        os.close(int(ready_fd))
+    else:
+        threading.Timer(1.0, warm_up).start()
+    _notify_systemd("READY=1")
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=reload, daemon=True).start())
+
+    _server.serve_forever()
+
+    # serve_forever() only returns after hot_restart() handed the socket over
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while _inflight > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    _server.server_close()
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser(description="Photo Match PWA")
     p.add_argument("--host",  default="0.0.0.0")
@@ -716,11 +2191,14 @@ if __name__ == "__main__":
         pass
     signal.signal(signal.SIGINT, signal.default_int_handler)
 
-    app.run(
-        host=args.host,
-        port=args.port,
-        debug=args.debug,
-        use_reloader=args.debug,
-        threaded=True,
-        ssl_context=ssl_ctx,
-    )
+    if args.debug:
+        app.run(
+            host=args.host,
+            port=args.port,
+            debug=True,
+            use_reloader=True,
+            threaded=True,
+            ssl_context=ssl_ctx,
+        )
+    else:
+        serve(args.host, args.port, ssl_ctx)
@@ -17,6 +17,8 @@ if errorlevel 1 (
     pause
     exit /b 1
 )
+REM -- Stamp the version so the app doesn't have to spawn git on startup
+git log -1 --format="%%h (%%cd)%%n%%H" --date=short > VERSION
 
 REM -- Install / update deps
 echo -- Installing dependencies...
@@ -27,6 +29,11 @@ if exist venv\Scripts\pip.exe (
     call setup.bat
 )
 
+REM -- Add the app's columns/tables (needs the owner of table wa)
+echo -- Updating database schema...
+venv\Scripts\python scripts\migrate.py
+if errorlevel 1 echo  WARNING: migration failed - run scripts\migrate.py as the owner of table wa
+
 REM -- Kill existing instance
 echo -- Stopping existing instance ^(if any^)...
 taskkill /FI "WINDOWTITLE eq photo_match" /F >nul 2>&1
@@ -8,6 +8,8 @@ cd "$APP_DIR"
 
 echo "=== Pulling latest ==="
 git pull
+# Stamp the version so the app doesn't have to spawn git on startup
+git log -1 --format='%h (%cd)%n%H' --date=short > VERSION
 
 echo "=== Installing/updating dependencies ==="
 if [ -d "venv" ]; then
@@ -17,11 +19,21 @@ else
     venv/bin/pip install -r requirements.txt --quiet
 fi
 
+echo "=== Updating database schema ==="
+venv/bin/python scripts/migrate.py || echo "⚠️  Migration failed — run scripts/migrate.py as the owner of table wa"
+
 echo "=== Restarting server ==="
-# Systemd
+# Graceful reload: the running server hands its socket to a fresh process
 if systemctl is-active --quiet photo-match 2>/dev/null; then
-    sudo systemctl restart photo-match
-    echo "Restarted via systemd"
+    if sudo systemctl reload photo-match 2>/dev/null; then
+        echo "Reloaded via systemd"
+    else
+        # Units installed before the hot-restart change have no ExecReload
+        sudo systemctl restart photo-match
+        echo "Restarted via systemd (reinstall photo-match.service for zero-downtime reloads, see README)"
+    fi
+elif pkill -HUP -f "python.*app.py" 2>/dev/null; then
+    echo "Sent SIGHUP — server is reloading in place"
 else
     pkill -f "python.*app.py" 2>/dev/null || true
     sleep 1
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py — cold-start benchmark
+Measures how long a fresh process takes to import app.py and how long
+`app.py` takes from exec to answering /health (what a deploy restart costs).
+
+Usage:
+    python3 scripts/bench_startup.py                  # 5 runs each
+    python3 scripts/bench_startup.py --runs 10
+    python3 scripts/bench_startup.py --max-ready-ms 1500   # exit 1 if slower (CI guard)
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PY  = os.path.join(APP_DIR, "app.py")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_import() -> float:
+    """Wall time (ms) for `python -c 'import app'` in a fresh interpreter."""
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=APP_DIR, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - t0) * 1000
+
+
+def time_ready(timeout: float = 30.0) -> float:
+    """Wall time (ms) from spawning app.py until /health returns 200."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, APP_PY, "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"server did not answer {url} within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def report(name: str, samples: list) -> float:
+    med = statistics.median(samples)
+    print(f"  {name:<10} median {med:7.1f} ms   min {min(samples):7.1f}   max {max(samples):7.1f}")
+    return med
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Photo Match cold-start benchmark")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--max-import-ms", type=float, default=0, help="Fail if median import time exceeds this")
+    p.add_argument("--max-ready-ms",  type=float, default=0, help="Fail if median time-to-/health exceeds this")
+    args = p.parse_args()
+
+    print(f"\n=== 📷 Photo Match cold start ({args.runs} runs) ===")
+    imp   = report("import", [time_import() for _ in range(args.runs)])
+    ready = report("ready", [time_ready() for _ in range(args.runs)])
+
+    failed = False
+    if args.max_import_ms and imp > args.max_import_ms:
+        print(f"✗ import {imp:.1f} ms > {args.max_import_ms} ms")
+        failed = True
+    if args.max_ready_ms and ready > args.max_ready_ms:
+        print(f"✗ ready {ready:.1f} ms > {args.max_ready_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+check_deploy.py — deploy lock regression check
+Drives app.do_deploy() / app.reload() through each outcome with git and the
+restart itself stubbed out, and checks the deploy lock is released on every
+path except a successful hot restart (where the old process is exiting).
+A leaked lock makes every later webhook / Deploy / SIGHUP a silent no-op.
+Also checks that under a pre-Type=notify systemd unit (INVOCATION_ID set,
+no NOTIFY_SOCKET) the restart happens in place instead of handing over.
+
+Usage:
+    python3 scripts/check_deploy.py        # exit 1 on any failure (CI guard)
+"""
+
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import app  # noqa: E402
+
+
+def run_case(name, fn, *, heads, pull_fails=False, hot_ok=False, expect_held=False,
+             env=None, expect_restart=None) -> bool:
+    shas = iter(heads)
+    restarts = []
+    env = env or {}
+
+    def fake_run(cmd, **kwargs):
+        if pull_fails:
+            raise subprocess.CalledProcessError(1, cmd)
+        return subprocess.CompletedProcess(cmd, 0)
+
+    real = (subprocess.run, app._git_head_sha, app.stamp_version, app.hot_restart,
+            app._restart_in_place, app._server)
+    real_env = {k: os.environ.get(k) for k in ("INVOCATION_ID", "NOTIFY_SOCKET")}
+    subprocess.run        = fake_run
+    app._git_head_sha     = lambda: next(shas)
+    app.stamp_version     = lambda: None
+    app.hot_restart       = lambda: restarts.append("hot") or hot_ok
+    app._restart_in_place = lambda: restarts.append("in place")   # the real one never returns
+    app._server           = object()   # take the hot-restart path unless the unit forbids it
+    for k in real_env:
+        os.environ.pop(k, None)
+    os.environ.update(env)
+    try:
+        fn()
+    finally:
+        (subprocess.run, app._git_head_sha, app.stamp_version, app.hot_restart,
+         app._restart_in_place, app._server) = real
+        for k, v in real_env.items():
+            os.environ.pop(k, None)
+            if v is not None:
+                os.environ[k] = v
+
+    held = app._deploy_lock.locked()
+    if held:
+        app._deploy_lock.release()
+    ok = held == expect_held and (expect_restart is None or restarts == [expect_restart])
+    print(f"  {'✓' if ok else '✗'} {name}: lock {'held' if held else 'free'}, "
+          f"restarts {restarts or 'none'}")
+    return ok
+
+
+def main() -> int:
+    if os.name == "nt":
+        print("  (hot restart is POSIX-only; nothing to check)")
+        return 0
+    results = [
+        run_case("deploy, HEAD unchanged",       app.do_deploy, heads=["a" * 40, "a" * 40]),
+        run_case("deploy, HEAD unchanged twice", lambda: (app.do_deploy(), app.do_deploy()),
+                 heads=["a" * 40] * 4),
+        run_case("deploy, git pull fails",       app.do_deploy, heads=["a" * 40], pull_fails=True),
+        run_case("deploy, hot restart fails",    app.do_deploy, heads=["a" * 40, "b" * 40]),
+        run_case("deploy, hot restart succeeds", app.do_deploy, heads=["a" * 40, "b" * 40],
+                 hot_ok=True, expect_held=True),
+        run_case("reload, hot restart fails",    app.reload, heads=[]),
+        run_case("reload, hot restart succeeds", app.reload, heads=[], hot_ok=True, expect_held=True),
+        run_case("deploy, Type=notify unit",     app.do_deploy, heads=["a" * 40, "b" * 40], hot_ok=True,
+                 expect_held=True, env={"INVOCATION_ID": "x", "NOTIFY_SOCKET": "/run/systemd/notify"},
+                 expect_restart="hot"),
+        run_case("deploy, old Type=simple unit", app.do_deploy, heads=["a" * 40, "b" * 40], hot_ok=True,
+                 env={"INVOCATION_ID": "x"}, expect_restart="in place"),
+        run_case("reload, old Type=simple unit", app.reload, heads=[], hot_ok=True,
+                 env={"INVOCATION_ID": "x"}, expect_restart="in place"),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+cluster_wa.py — runs on the server
+Group near-duplicate pending `wa` rows (forwarded copies of the same media)
+so /api/match shows each group once and one decision resolves all copies.
+
+Usage:
+    python3 scripts/cluster_wa.py               # WA_CLUSTER_DISTANCE (default 4)
+    python3 scripts/cluster_wa.py --distance 0  # exact duplicates only
+
+Safe to re-run at any time; ingest_media.py runs it after inserting rows.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import connect_db, cluster_wa, WA_CLUSTER_DISTANCE
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Cluster near-duplicate WA rows")
+    p.add_argument("--distance", type=int, default=WA_CLUSTER_DISTANCE,
+                   help="Max Hamming distance between copies")
+    args = p.parse_args()
+
+    t0 = time.monotonic()
+    conn = connect_db()
+    try:
+        groups, rows = cluster_wa(conn, args.distance)
+    finally:
+        conn.close()
+    print(f"✓ {rows} rows in {groups} groups (distance ≤ {args.distance}, {time.monotonic() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+export_decisions.py — runs on the server
+Stream match decisions (wa joined to hashes) to stdout or a file.
+
+Usage:
+    python3 scripts/export_decisions.py                        # NDJSON to stdout
+    python3 scripts/export_decisions.py --format csv -o out.csv
+    python3 scripts/export_decisions.py --since 2024-05-01T00:00:00 --status decided
+
+Uses the same config.json as the app. Rows are read through a server-side
+cursor, so memory use does not grow with the size of `wa`.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import connect_db, iter_decisions, format_decisions, parse_since
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Export Photo Match decisions")
+    p.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    p.add_argument("--since",  default="", help="Only rows decided at/after this ISO timestamp")
+    p.add_argument("--status", choices=["all", "decided", "pending"], default="all")
+    p.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    args = p.parse_args()
+
+    conn = connect_db()
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    rows = 0
+    try:
+        for chunk in format_decisions(iter_decisions(conn, parse_since(args.since), args.status), args.format):
+            out.write(chunk)
+            rows += chunk.count("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        conn.close()
+    if args.output != "-":
+        print(f"✓ Wrote {rows} lines → {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+ingest_media.py — runs on the server
+Scan static/Media… for WhatsApp files not yet in `wa`, compute pHash +
+thumbnail on a process pool and bulk-insert them with COPY.
+
+Usage:
+    python3 scripts/ingest_media.py                 # all cores
+    python3 scripts/ingest_media.py --workers 4 --batch 1000
+    python3 scripts/ingest_media.py --dry-run       # just count new files
+
+Resumable: files whose filename is already in `wa` are skipped, and every
+batch is committed on its own, so an interrupted run picks up where it
+stopped. Videos need `ffmpeg` on PATH to grab a keyframe; videos without
+a frame are reported and left for a later run.
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import connect_db, cluster_wa, video_frame, VIDEO_EXTS
+
+APP_DIR    = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".heic", ".gif"}
+THUMB_SIZE = 256
+WA_DATE_RE = re.compile(r"(\d{8})-WA\d+", re.IGNORECASE)   # IMG-20240501-WA0001.jpg
+
+
+# ── Scanning ──────────────────────────────────────────────────────────────────
+
+def scan_media(static_dir: str):
+    """Yield paths (relative to static/, '/' separated) under every Media… dir."""
+    for entry in sorted(os.listdir(static_dir)):
+        root = os.path.join(static_dir, entry)
+        if not entry.startswith("Media") or not os.path.isdir(root):
+            continue
+        for dirpath, _, files in os.walk(root):
+            for name in sorted(files):
+                ext = os.path.splitext(name)[1].lower()
+                if ext in IMAGE_EXTS or ext in VIDEO_EXTS:
+                    rel = os.path.relpath(os.path.join(dirpath, name), static_dir)
+                    yield rel.replace(os.sep, "/")
+
+
+def known_filenames(conn) -> set:
+    """All filenames already in `wa`, read through a server-side cursor."""
+    cur = conn.cursor(name="ingest_known")
+    cur.itersize = 10000
+    cur.execute("SELECT filename FROM wa WHERE filename LIKE 'Media%'")
+    names = {r[0] for r in cur}
+    cur.close()
+    conn.rollback()
+    return names
+
+
+# ── Per-file work (runs in the pool) ──────────────────────────────────────────
+
+def _signed64(h) -> int:
+    """imagehash → signed BIGINT, the same encoding as the `hash` columns."""
+    v = int(str(h), 16)
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+
+def _video_frame(path: str):
+    """Grab one keyframe as a PIL image (see app.video_frame), or None."""
+    from PIL import Image
+    frame = video_frame(path)
+    return Image.open(io.BytesIO(frame)) if frame else None
+
+
+def _timestamp(rel: str, img, path: str):
+    """WhatsApp filename date → EXIF DateTimeOriginal → file mtime (all UTC)."""
+    m = WA_DATE_RE.search(os.path.basename(rel))
+    if m:
+        try:
+            return datetime.datetime.strptime(m.group(1), "%Y%m%d").replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            pass
+    if img is not None:
+        try:
+            raw = img.getexif().get_ifd(0x8769).get(36867)   # DateTimeOriginal
+            if raw:
+                return datetime.datetime.strptime(raw, "%Y:%m:%d %H:%M:%S").replace(tzinfo=datetime.timezone.utc)
+        except Exception:
+            pass
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path), tz=datetime.timezone.utc)
+
+
+def process_file(rel: str):
+    """
+    Return (rel, row) where row is the tuple to COPY into `wa`,
+    or (rel, None) when no usable image could be read.
+    """
+    import imagehash
+    from PIL import Image, ImageOps
+    path = os.path.join(STATIC_DIR, rel)
+    is_video = os.path.splitext(rel)[1].lower() in VIDEO_EXTS
+    try:
+        if is_video:
+            img = _video_frame(path)
+            if img is None:
+                return rel, None
+        else:
+            img = ImageOps.exif_transpose(Image.open(path))
+        ts = _timestamp(rel, None if is_video else img, path)
+        img = img.convert("RGB")
+        full_hash = _signed64(imagehash.phash(img))
+        thumb = img.copy()
+        thumb.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        buf = io.BytesIO()
+        thumb.save(buf, "JPEG", quality=80)
+        thumb_hash = _signed64(imagehash.phash(thumb))
+    except Exception:
+        return rel, None
+    return rel, (
+        rel,
+        "Video" if is_video else "Image",
+        full_hash,
+        thumb_hash,
+        "\\x" + buf.getvalue().hex(),   # bytea hex input
+        ts.isoformat(),
+    )
+
+
+# ── Bulk insert ───────────────────────────────────────────────────────────────
+
+def copy_rows(conn, rows) -> None:
+    """COPY one batch into `wa` and commit it."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(
+            "COPY wa (filename, filetype, hash, video_thumb_hash, thumbnail, timestamp) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+    conn.commit()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Ingest new WhatsApp media into wa")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    p.add_argument("--batch",   type=int, default=500, help="Rows per COPY/commit")
+    p.add_argument("--dry-run", action="store_true")
+    args = p.parse_args()
+
+    conn = connect_db()
+    known = known_filenames(conn)
+    todo = [rel for rel in scan_media(STATIC_DIR) if rel not in known]
+    print(f"\n=== 📷 Photo Match ingest ===")
+    print(f"Known in wa : {len(known)}")
+    print(f"New files   : {len(todo)}")
+    if args.dry_run or not todo:
+        conn.close()
+        return
+
+    t0 = time.monotonic()
+    done = inserted = failed = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for rel, row in pool.map(process_file, todo, chunksize=8):
+            done += 1
+            if row is None:
+                failed += 1
+                print(f"  ✗ no image: {rel}", file=sys.stderr)
+            else:
+                batch.append(row)
+            if len(batch) >= args.batch or done == len(todo):
+                if batch:
+                    copy_rows(conn, batch)
+                    inserted += len(batch)
+                    batch = []
+                rate = done / max(time.monotonic() - t0, 1e-6)
+                eta  = (len(todo) - done) / rate if rate else 0
+                print(f"  {done}/{len(todo)}  {rate:6.1f} files/s  ETA {eta:5.0f}s")
+    if inserted:
+        groups, rows = cluster_wa(conn)
+        print(f"  near-duplicates: {rows} rows in {groups} groups")
+    conn.close()
+
+    elapsed = time.monotonic() - t0
+    print(f"\n✓ Inserted {inserted}, skipped {failed}, {elapsed:.1f}s "
+          f"({done / max(elapsed, 1e-6):.1f} files/s, {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
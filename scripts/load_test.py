@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+load_test.py — concurrency / traffic-replay harness
+Seeds a scratch Postgres with synthetic wa / hashes / partner rows, starts
+app.py against it and drives it with N simulated reviewers at a time,
+reporting throughput, tail latency, errors and DB connections per level.
+
+Usage:
+    # Scratch cluster in a temp dir (needs initdb + pg_ctl on PATH)
+    python3 scripts/load_test.py --temp-cluster --levels 1,2,4,8,16
+
+    # An existing, disposable database (it is wiped and re-seeded)
+    python3 scripts/load_test.py --dsn "dbname=photo_match_load user=me" --seed
+
+    # Replay recorded traffic (start the app with REQUEST_LOG=requests.ndjson)
+    python3 scripts/load_test.py --temp-cluster --replay requests.ndjson --speed 4
+
+    # Read-only run against a live server (no commits/undo), sampling its DB
+    python3 scripts/load_test.py --url http://localhost:5000 --dsn "dbname=photos" --read-only
+
+Simulated reviewers follow the page's flow in templates/index.html: load
+/api/match/<offset>, fetch the item + candidate thumbnails, prefetch the
+next offset, think, then commit (re-loading the same offset) or step
+next/prev, with the occasional undo and a /health poll every 30s.
+Never point --seed or --temp-cluster's reset at a real database.
+"""
+
+import argparse
+import collections
+import datetime
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PY  = os.path.join(APP_DIR, "app.py")
+
+KINDS = ("match", "thumb", "commit", "undo", "health", "other")
+
+
+# ── Scratch Postgres ──────────────────────────────────────────────────────────
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TempCluster:
+    """A throwaway Postgres cluster in a temp dir, listening on a unix socket only."""
+
+    def __init__(self):
+        for tool in ("initdb", "pg_ctl"):
+            if not shutil.which(tool):
+                sys.exit(f"✗ {tool} not found on PATH (install PostgreSQL server binaries or use --dsn)")
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            sys.exit("✗ initdb refuses to run as root — run as an unprivileged user or use --dsn")
+        self.dir  = tempfile.mkdtemp(prefix="photo-match-pg-")
+        self.data = os.path.join(self.dir, "data")
+        self.port = free_port()
+
+    def start(self) -> str:
+        subprocess.run(["initdb", "-D", self.data, "-U", "postgres", "--auth", "trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        opts = f"-p {self.port} -k {self.dir} -c listen_addresses='' -c max_connections=300 -c fsync=off"
+        subprocess.run(["pg_ctl", "-D", self.data, "-o", opts, "-l", os.path.join(self.dir, "pg.log"),
+                        "-w", "start"], check=True, stdout=subprocess.DEVNULL)
+        import psycopg2
+        conn = psycopg2.connect(dbname="postgres", user="postgres", host=self.dir, port=self.port)
+        conn.autocommit = True
+        conn.cursor().execute("CREATE DATABASE photo_match_load")
+        conn.close()
+        return f"dbname=photo_match_load user=postgres host={self.dir} port={self.port}"
+
+    def stop(self) -> None:
+        subprocess.run(["pg_ctl", "-D", self.data, "-m", "fast", "-w", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# Stand-ins for the Hamming operators the production DB gets from its
+# similarity extension: `a <-> b` (bit distance) and `h <@ (target, radius)`.
+SCHEMA_SQL = """
+DROP TABLE IF EXISTS wa, wa_lease, hashes, partner CASCADE;
+
+CREATE OR REPLACE FUNCTION lt_hamming(a bigint, b bigint) RETURNS integer
+    LANGUAGE sql IMMUTABLE STRICT
+    AS $$ SELECT length(replace((a # b)::bit(64)::text, '0', '')) $$;
+
+CREATE OR REPLACE FUNCTION lt_hamming_within(h bigint, area record) RETURNS boolean
+    LANGUAGE plpgsql IMMUTABLE STRICT
+    AS $$ BEGIN RETURN lt_hamming(h, area.f1::bigint) <= area.f2::integer; END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_operator WHERE oprname = '<->'
+                   AND oprleft = 'bigint'::regtype AND oprright = 'bigint'::regtype) THEN
+        CREATE OPERATOR <-> (LEFTARG = bigint, RIGHTARG = bigint, FUNCTION = lt_hamming, COMMUTATOR = <->);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_operator WHERE oprname = '<@'
+                   AND oprleft = 'bigint'::regtype AND oprright = 'record'::regtype) THEN
+        CREATE OPERATOR <@ (LEFTARG = bigint, RIGHTARG = record, FUNCTION = lt_hamming_within);
+    END IF;
+END $$;
+
+CREATE TABLE hashes (
+    id serial PRIMARY KEY, filename text, hash bigint, video_thumb_hash bigint,
+    camera_name text, location text, timestamp timestamptz, url text, preview_url text,
+    origin text, size text, filesize text, thumbnail bytea
+);
+CREATE TABLE partner (
+    id serial PRIMARY KEY, filename text, hash bigint, video_thumb_hash bigint,
+    camera_name text, location text, timestamp timestamptz, url text,
+    size text, filesize text, thumbnail bytea
+);
+CREATE TABLE wa (
+    id serial PRIMARY KEY, filename text, filetype text, hash bigint, video_thumb_hash bigint,
+    ids_hash integer[], id_hash integer, processed boolean, thumbnail bytea, timestamp timestamptz,
+    decided_at timestamptz, cluster_id integer
+);
+CREATE TABLE wa_lease (
+    wa_id integer PRIMARY KEY, holder text NOT NULL, expires_at timestamptz NOT NULL
+);
+CREATE INDEX hashes_timestamp_idx  ON hashes  (timestamp);
+CREATE INDEX partner_timestamp_idx ON partner (timestamp);
+CREATE INDEX wa_timestamp_idx      ON wa      (timestamp DESC, id);
+"""
+
+
+def _signed(v: int) -> int:
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+
+def _near(h: int, bits: int, rng: random.Random) -> int:
+    """Flip `bits` random bits of an unsigned 64-bit hash."""
+    for b in rng.sample(range(64), bits):
+        h ^= 1 << b
+    return h
+
+
+def _thumbnails(n: int, rng: random.Random) -> list:
+    """n small distinct JPEGs (noise over a flat colour) so pixel_distance has real work."""
+    from PIL import Image
+    out = []
+    for _ in range(n):
+        img = Image.effect_noise((96, 96), rng.randint(10, 80)).convert("RGB")
+        img = Image.blend(img, Image.new("RGB", img.size, tuple(rng.randrange(256) for _ in range(3))), 0.6)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=75)
+        out.append(buf.getvalue())
+    return out
+
+
+def seed(dsn: str, n_hashes: int, n_partner: int, n_wa: int, rng_seed: int = 1) -> None:
+    """Recreate wa/hashes/partner with synthetic, hash-correlated rows."""
+    import psycopg2
+    import psycopg2.extras
+    rng   = random.Random(rng_seed)
+    thumbs = [psycopg2.Binary(t) for t in _thumbnails(64, rng)]
+    start = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    span  = 10 * 365 * 86400
+
+    def ts():
+        return start + datetime.timedelta(seconds=rng.randrange(span))
+
+    # Photos come in bursts of near-identical shots, which is what makes
+    # some neighbourhoods dense and others empty.
+    centers = [rng.getrandbits(64) for _ in range(max(1, n_hashes // 8))]
+    hashes  = []
+    for i in range(n_hashes):
+        h = _near(rng.choice(centers), rng.randint(0, 10), rng)
+        hashes.append((f"IMG_{i:06d}.jpg", _signed(h), _signed(_near(h, 3, rng)),
+                       rng.choice([None, "iPhone 12", "Pixel 7"]), rng.choice([None, "52.37,4.89"]),
+                       ts(), f"https://photos.example/{i}", None, rng.choice(["camera", "scan"]),
+                       "4032x3024", "2.1 MB (2202009)", rng.choice(thumbs)))
+    partner = []
+    for i in range(n_partner):
+        h = _near(rng.choice(centers), rng.randint(0, 12), rng)
+        partner.append((f"PXL_{i:06d}.jpg", _signed(h), _signed(_near(h, 3, rng)),
+                        None, None, ts(), None, "4000x3000", "1.8 MB", rng.choice(thumbs)))
+    wa = []
+    for i in range(n_wa):
+        video = rng.random() < 0.15
+        h = _near(rng.choice(centers), rng.randint(2, 14), rng) if rng.random() < 0.8 else rng.getrandbits(64)
+        wa.append((f"Media/WhatsApp Images/IMG-2020{i:04d}-WA{i % 10:04d}.jpg",
+                   "Video" if video else "Image", _signed(h), _signed(_near(h, 2, rng)),
+                   rng.choice(thumbs), ts()))
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO hashes (filename, hash, video_thumb_hash, camera_name, location, timestamp,
+                                url, preview_url, origin, size, filesize, thumbnail) VALUES %s""",
+            hashes, page_size=1000)
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO partner (filename, hash, video_thumb_hash, camera_name, location, timestamp,
+                                 url, size, filesize, thumbnail) VALUES %s""",
+            partner, page_size=1000)
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO wa (filename, filetype, hash, video_thumb_hash, thumbnail, timestamp) VALUES %s""",
+            wa, page_size=1000)
+    conn.commit()
+    from app import ensure_schema
+    ensure_schema(conn)   # the app's own indexes, as scripts/migrate.py would add them
+    conn.close()
+    print(f"  seeded {n_hashes} hashes, {n_partner} partner, {n_wa} wa")
+
+
+def reset_decisions(dsn: str) -> None:
+    """Put every wa row back in the queue between levels, ungrouped and unleased."""
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute("UPDATE wa SET id_hash = NULL, processed = NULL, decided_at = NULL, cluster_id = NULL "
+                    "WHERE id_hash IS NOT NULL OR processed IS NOT NULL OR cluster_id IS NOT NULL")
+        # Each level uses fresh session ids, so the last level's leases would
+        # otherwise hide rows for LEASE_SECONDS
+        cur.execute("DELETE FROM wa_lease")
+    conn.commit()
+    conn.close()
+
+
+# ── App under test ────────────────────────────────────────────────────────────
+
+def start_app(dsn: str, workdir: str):
+    """Run app.py against `dsn` on a free port; returns (proc, base_url)."""
+    import psycopg2.extensions
+    params = psycopg2.extensions.parse_dsn(dsn)
+    config = os.path.join(workdir, "config.json")
+    with open(config, "w") as f:
+        json.dump({
+            "DB_NAME":     params.get("dbname", ""),
+            "DB_USER":     params.get("user", ""),
+            "DB_PASSWORD": params.get("password", ""),
+            "DB_HOST":     params.get("host", "localhost"),
+            "DB_PORT":     int(params.get("port", 5432)),
+        }, f)
+    port = free_port()
+    env = dict(os.environ, PHOTO_MATCH_CONFIG=config,
+               SNAPSHOT_PATH=os.path.join(workdir, "warm_state.json.gz"))
+    log = open(os.path.join(workdir, "app.log"), "w")
+    proc = subprocess.Popen([sys.executable, APP_PY, "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"✗ app.py exited early — see {log.name}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc, url
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    sys.exit("✗ app.py did not start listening within 30s")
+
+
+# ── Traffic ───────────────────────────────────────────────────────────────────
+
+class Client:
+    """One keep-alive HTTP/1.1 connection, like a browser tab's."""
+
+    def __init__(self, base_url: str, stats, sid: str):
+        u = urllib.parse.urlsplit(base_url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.stats, self.sid = stats, sid
+        self.conn = None
+
+    def request(self, kind: str, method: str, path: str, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"X-Session-Id": self.sid}
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+        t0 = time.perf_counter()
+        status, payload = 0, None
+        for attempt in (1, 2):   # one retry on a dropped keep-alive connection
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                self.conn.request(method, path, body=data, headers=headers)
+                r = self.conn.getresponse()
+                raw = r.read()
+                status = r.status
+                if r.getheader("Connection", "").lower() == "close":
+                    self.conn.close()
+                    self.conn = None
+                if r.getheader("Content-Type", "").startswith("application/json"):
+                    payload = json.loads(raw)
+                break
+            except (OSError, http.client.HTTPException, ValueError):
+                if self.conn:
+                    self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    status = 0
+        self.stats.add(kind, (time.perf_counter() - t0) * 1000, 200 <= status < 400)
+        return status, payload
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(list)   # kind → [ms]
+        self.errors  = collections.Counter()
+
+    def add(self, kind: str, ms: float, ok: bool) -> None:
+        with self.lock:
+            self.samples[kind].append(ms)
+            if not ok:
+                self.errors[kind] += 1
+
+
+def model_session(client: Client, stop: threading.Event, rng: random.Random,
+                  think_ms: float, read_only: bool) -> None:
+    """One reviewer working through the queue the way templates/index.html does."""
+    offset, last_health = 0, 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_health > 30:
+            client.request("health", "GET", "/health")
+            last_health = time.monotonic()
+        status, data = client.request("match", "GET", f"/api/match/{offset}")
+        if status != 200 or not data or not data.get("item"):
+            offset = 0
+            stop.wait(1)
+            continue
+        item = data["item"]
+        client.request("thumb", "GET", item["thumbnail_url"])
+        for c in data["candidates"] + data.get("partner_candidates", []):
+            client.request("thumb", "GET", c["thumbnail_url"])
+        client.request("match", "GET", f"/api/match/{offset + 1}?peek=1")   # prefetchNext
+        stop.wait(rng.expovariate(1000 / think_ms) if think_ms else 0)
+        if stop.is_set():
+            break
+        roll = rng.random()
+        choice = data.get("auto_select_id") or (data["candidates"][0]["id"] if data["candidates"] else None)
+        if not read_only and roll < 0.7 and choice:
+            client.request("commit", "POST", "/api/match/commit",
+                           {"wa_id": item["id"], "hash_id": choice, "offset": offset})
+        elif not read_only and roll < 0.75 and data.get("has_undo"):   # the page only shows Undo then
+            client.request("undo", "POST", "/api/match/undo")
+        elif roll < 0.95:
+            offset += 1
+        else:
+            offset = max(0, offset - 1)
+
+
+def load_recording(path: str) -> list:
+    """REQUEST_LOG lines → list of sessions, each [(delay_s, method, path, body), ...]."""
+    lines = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                lines.append(json.loads(line))
+    lines.sort(key=lambda r: r["t"])
+    sessions, last = collections.OrderedDict(), {}
+    recent_sid = None
+    for r in lines:
+        sid = r.get("sid")
+        # Thumbnail <img> loads carry no session header — attach them to the
+        # session that was active within the last few seconds
+        if not sid and recent_sid and r["t"] - last[recent_sid] < 5:
+            sid = recent_sid
+        sid = sid or "anon"
+        delay = r["t"] - last.get(sid, r["t"])
+        sessions.setdefault(sid, []).append((delay, r["method"], r["path"], r.get("body")))
+        last[sid] = r["t"]
+        if sid != "anon":
+            recent_sid = sid
+    return list(sessions.values())
+
+
+def _kind(path: str) -> str:
+    if path.startswith("/api/match/commit"):
+        return "commit"
+    if path.startswith("/api/match/undo"):
+        return "undo"
+    if path.startswith("/api/match"):
+        return "match"
+    if "thumbnail" in path:
+        return "thumb"
+    if path.startswith("/health"):
+        return "health"
+    return "other"
+
+
+def replay_session(client: Client, stop: threading.Event, sessions: list, start: int,
+                   speed: float, read_only: bool) -> None:
+    """Replay recorded sessions back to back (round-robin from `start`) until stopped."""
+    i = start
+    while not stop.is_set():
+        for delay, method, path, body in sessions[i % len(sessions)]:
+            if stop.wait(min(delay / speed, 10) if speed else 0):
+                return
+            kind = _kind(path)
+            if read_only and method != "GET":
+                continue
+            client.request(kind, method, path, body)
+        i += 1
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def sample_connections(dsn: str, stop: threading.Event, out: list) -> None:
+    """Backends on the app's database every 250ms (excluding this sampler)."""
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        while not stop.wait(0.25):
+            cur.execute("SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND pid <> pg_backend_pid()")
+            out.append(cur.fetchone()[0])
+    conn.close()
+
+
+def pct(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def run_level(users: int, args, base_url: str, dsn: str, sessions) -> dict:
+    stats, stop = Stats(), threading.Event()
+    conns: list = []
+    threads = []
+    if dsn:
+        threads.append(threading.Thread(target=sample_connections, args=(dsn, stop, conns), daemon=True))
+    clients = [Client(base_url, stats, f"load-{users}-{i}") for i in range(users)]
+    for i, client in enumerate(clients):
+        if sessions:
+            target = (replay_session, (client, stop, sessions, i, args.speed, args.read_only))
+        else:
+            target = (model_session, (client, stop, random.Random(i), args.think_ms, args.read_only))
+        threads.append(threading.Thread(target=target[0], args=target[1], daemon=True))
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    stop.wait(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=35)
+    elapsed = time.monotonic() - t0
+    for c in clients:
+        c.close()
+
+    every = [ms for kind in stats.samples for ms in stats.samples[kind]]
+    total = len(every)
+    errors = sum(stats.errors.values())
+    return {
+        "users":      users,
+        "requests":   total,
+        "rps":        total / elapsed,
+        "p50_ms":     pct(every, 0.50),
+        "p95_ms":     pct(every, 0.95),
+        "p99_ms":     pct(every, 0.99),
+        "error_rate": errors / total if total else 0.0,
+        "db_conns_max": max(conns) if conns else None,
+        "db_conns_avg": sum(conns) / len(conns) if conns else None,
+        "by_kind": {
+            kind: {"n": len(stats.samples[kind]), "p99_ms": pct(stats.samples[kind], 0.99),
+                   "errors": stats.errors[kind]}
+            for kind in KINDS if stats.samples[kind]
+        },
+    }
+
+
+def print_row(r: dict) -> None:
+    conns = "—" if r["db_conns_max"] is None else f"{r['db_conns_max']:>3} / {r['db_conns_avg']:5.1f}"
+    print(f"  {r['users']:>5}  {r['rps']:7.1f}  {r['p50_ms']:7.1f}  {r['p95_ms']:7.1f}  {r['p99_ms']:7.1f}"
+          f"  {100 * r['error_rate']:6.2f}%  {conns}")
+    print("         " + "  ".join(f"{k} p99 {v['p99_ms']:.0f}ms ({v['n']}{', ' + str(v['errors']) + ' err' if v['errors'] else ''})"
+                                for k, v in r["by_kind"].items()))
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Photo Match load test")
+    where = p.add_mutually_exclusive_group(required=True)
+    where.add_argument("--temp-cluster", action="store_true", help="initdb a scratch cluster (seeded)")
+    where.add_argument("--dsn", help="libpq DSN of the database the app uses")
+    p.add_argument("--seed",      action="store_true", help="Wipe and seed --dsn with synthetic data")
+    p.add_argument("--url",       default="", help="Test an already running server instead of starting app.py")
+    p.add_argument("--hashes",    type=int, default=20000)
+    p.add_argument("--partner",   type=int, default=5000)
+    p.add_argument("--wa",        type=int, default=3000)
+    p.add_argument("--levels",    default="1,2,4,8,16", help="Concurrent reviewers per step")
+    p.add_argument("--duration",  type=float, default=20, help="Seconds per level")
+    p.add_argument("--think-ms",  type=float, default=800, help="Mean reviewer think time")
+    p.add_argument("--replay",    default="", help="REQUEST_LOG file to replay instead of the model")
+    p.add_argument("--speed",     type=float, default=1.0, help="Replay speed-up (0 = no gaps)")
+    p.add_argument("--read-only", action="store_true", help="Never commit/undo")
+    p.add_argument("--json",      default="", help="Also write results to this file")
+    args = p.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    cluster, proc = None, None
+    workdir = tempfile.mkdtemp(prefix="photo-match-load-")
+    print("\n=== 📷 Photo Match load test ===")
+    try:
+        if args.temp_cluster:
+            cluster = TempCluster()
+            dsn = cluster.start()
+            args.seed = True
+        else:
+            dsn = args.dsn
+        if args.seed:
+            seed(dsn, args.hashes, args.partner, args.wa)
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            proc, base_url = start_app(dsn, workdir)
+        sessions = load_recording(args.replay) if args.replay else None
+        if sessions is not None and not sessions:
+            sys.exit(f"✗ no requests in {args.replay}")
+
+        print(f"  target {base_url}  ({'replay of ' + str(len(sessions)) + ' sessions' if sessions else 'model'}"
+              f"{', read-only' if args.read_only else ''})\n")
+        print("  users    req/s   p50 ms   p95 ms   p99 ms   errors  db conns max / avg")
+        results = []
+        for users in [int(x) for x in args.levels.split(",") if x.strip()]:
+            if args.seed and not args.read_only:
+                reset_decisions(dsn)
+            r = run_level(users, args, base_url, dsn, sessions)
+            results.append(r)
+            print_row(r)
+        if len(results) > 1 and results[0]["rps"]:
+            base = results[0]
+            last = results[-1]
+            print(f"\n  scaling {base['users']}→{last['users']} users: "
+                  f"{last['rps'] / base['rps']:.1f}× throughput, p99 {base['p99_ms']:.0f}→{last['p99_ms']:.0f} ms")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"  ✓ results → {args.json}")
+    finally:
+        if proc:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if cluster:
+            cluster.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
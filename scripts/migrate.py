@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+migrate.py — runs on the server
+Add the columns/tables the app owns on top of the documented schema
+(wa.decided_at, wa.cluster_id, wa_lease and their indexes).
+
+Usage:
+    python3 scripts/migrate.py            # apply (idempotent)
+    python3 scripts/migrate.py --check    # exit 1 if anything is missing
+
+Run it as the owner of table `wa` (setup.sh / deploy.sh and the webhook
+deploy do this with config.json's credentials). If the app connects with a
+role that doesn't own the tables, point PHOTO_MATCH_CONFIG at an owner's
+config for this step.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import connect_db, ensure_schema, missing_schema
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Apply the Photo Match schema additions")
+    p.add_argument("--check", action="store_true", help="Only report what is missing")
+    args = p.parse_args()
+
+    conn = connect_db()
+    try:
+        missing = missing_schema(conn)
+        if args.check:
+            print(f"✗ missing: {', '.join(missing)}" if missing else "✓ schema up to date")
+            return 1 if missing else 0
+        ensure_schema(conn)
+    except Exception as e:
+        print(f"✗ migration failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    print(f"✓ added {', '.join(missing)}" if missing else "✓ schema up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
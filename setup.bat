@@ -39,6 +39,10 @@ if not exist config.json (
     echo    Copy config.example.json and fill in your database credentials:
     echo      copy config.example.json config.json
     echo      notepad config.json
+    echo    then run: venv\Scripts\python scripts\migrate.py
+) else (
+    echo -- Updating database schema...
+    venv\Scripts\python scripts\migrate.py
 )
 
 echo.
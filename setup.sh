@@ -22,6 +22,10 @@ if [ ! -f "$APP_DIR/config.json" ]; then
     echo "⚠️  No config.json found."
     echo "   Copy config.example.json and fill in your database credentials:"
     echo "   cp config.example.json config.json && nano config.json"
+    echo "   then run: venv/bin/python scripts/migrate.py"
+else
+    echo "→ Updating database schema..."
+    "$APP_DIR/venv/bin/python" "$APP_DIR/scripts/migrate.py"
 fi
 
 echo ""
@@ -1,7 +1,7 @@
 // Photo Match PWA — Service Worker
 // Provides offline shell, caching, and background sync
 
-const CACHE_VERSION = "photo-match-v1";
+const CACHE_VERSION = "photo-match-v2";
 const STATIC_CACHE  = `${CACHE_VERSION}-static`;
 const THUMB_CACHE   = `${CACHE_VERSION}-thumbnails`;
 
@@ -12,6 +12,20 @@ const PRECACHE_URLS = [
   "/static/icons/icon-512.png",
 ];
 
+const THUMB_PREFIXES = [
+  "/api/thumbnail/",
+  "/api/partner-thumbnail/",
+  "/api/wa-thumbnail/",
+  "/api/media-preview/",
+  "/static/thumbnails_cache/",
+];
+
+// Thumbnail cache budget — least recently used entries are evicted past either limit
+const THUMB_MAX_ENTRIES    = 3000;
+const THUMB_MAX_BYTES      = 60 * 1024 * 1024;
+const PREFETCH_CONCURRENCY = 4;
+const PREFETCH_MAX_URLS    = 120;   // per message
+
 // ── Offline shell ─────────────────────────────────────────────────────────────
 const OFFLINE_HTML = `<!DOCTYPE html>
 <html lang="en">
@@ -45,11 +59,149 @@ button:hover{opacity:.85}
 </body>
 </html>`;
 
-// ── Lifecycle: install ─────────────────────────────────────────────────────────
+// ── Thumbnail LRU bookkeeping ──────────────────────────────────────────────────
+// CacheStorage has no access times or sizes, so url → {size, used} lives in
+// IndexedDB (survives the worker being stopped between events).
+const thumbStats = { hits: 0, misses: 0, prefetched: 0, evicted: 0 };  // since worker start
+let lruDbPromise = null;
+let enforceTimer = null;
+const prefetching = new Set();
+
+function lruDb() {
+  if (!lruDbPromise) {
+    lruDbPromise = new Promise((resolve, reject) => {
+      const req = indexedDB.open(`${CACHE_VERSION}-thumb-lru`, 1);
+      req.onupgradeneeded = () => {
+        req.result.createObjectStore("thumbs", { keyPath: "url" }).createIndex("used", "used");
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror   = () => { lruDbPromise = null; reject(req.error); };
+    });
+  }
+  return lruDbPromise;
+}
+
+async function lruTx(mode, fn) {
+  const db = await lruDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction("thumbs", mode);
+    const result = fn(tx.objectStore("thumbs"));
+    tx.oncomplete = () => resolve(result?.result ?? result);
+    tx.onerror    = () => reject(tx.error);
+  });
+}
+
+function lruTouch(url, size) {
+  return lruTx("readwrite", store => {
+    const get = store.get(url);
+    get.onsuccess = () => store.put({ url, size: size ?? get.result?.size ?? 0, used: Date.now() });
+  }).catch(() => {});
+}
+
+function lruAll() {
+  // Oldest first
+  return lruTx("readonly", store => store.index("used").getAll()).catch(() => []);
+}
+
+async function lruEnforce() {
+  const entries = await lruAll();
+  let bytes = entries.reduce((n, t) => n + t.size, 0);
+  let count = entries.length;
+  const victims = [];
+  for (const t of entries) {
+    if (count <= THUMB_MAX_ENTRIES && bytes <= THUMB_MAX_BYTES) break;
+    victims.push(t.url);
+    count--;
+    bytes -= t.size;
+  }
+  if (!victims.length) return;
+  const c = await caches.open(THUMB_CACHE);
+  await Promise.all(victims.map(u => c.delete(u)));
+  await lruTx("readwrite", store => victims.forEach(u => store.delete(u))).catch(() => {});
+  thumbStats.evicted += victims.length;
+}
+
+function scheduleEnforce() {
+  // Coalesce bursts of puts (prefetch) into one pass
+  if (enforceTimer) return Promise.resolve();
+  return new Promise(resolve => {
+    enforceTimer = setTimeout(() => {
+      enforceTimer = null;
+      lruEnforce().catch(() => {}).then(resolve);
+    }, 2000);
+  });
+}
+
+async function storeThumb(cache, url, res) {
+  const size = Number(res.headers.get("Content-Length")) || (await res.clone().blob()).size;
+  await cache.put(url, res);
+  await lruTouch(url, size);
+  await scheduleEnforce();
+}
+
+async function prefetchThumbs(urls) {
+  const c = await caches.open(THUMB_CACHE);
+  const todo = [];
+  for (const u of new Set(urls.slice(0, PREFETCH_MAX_URLS))) {
+    const url = new URL(u, self.location.origin).href;
+    if (prefetching.has(url) || await c.match(url)) continue;
+    prefetching.add(url);
+    todo.push(url);
+  }
+  const worker = async () => {
+    while (todo.length) {
+      const url = todo.shift();
+      try {
+        const res = await fetch(url);
+        if (res.status === 200) {
+          await storeThumb(c, url, res);
+          thumbStats.prefetched++;
+        }
+      } catch {} finally {
+        prefetching.delete(url);
+      }
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(PREFETCH_CONCURRENCY, todo.length) }, worker));
+}
+
+async function thumbCacheStats() {
+  const entries = await lruAll();
+  return {
+    entries:    entries.length,
+    bytes:      entries.reduce((n, t) => n + t.size, 0),
+    maxEntries: THUMB_MAX_ENTRIES,
+    maxBytes:   THUMB_MAX_BYTES,
+    ...thumbStats,
+  };
+}
+
+async function serveThumb(e) {
+  const c = await caches.open(THUMB_CACHE);
+  const cached = await c.match(e.request);
+  if (cached) {
+    thumbStats.hits++;
+    e.waitUntil(lruTouch(e.request.url));
+    return cached;
+  }
+  thumbStats.misses++;
+  const res = await fetch(e.request);
+  if (res.status === 200) e.waitUntil(storeThumb(c, e.request.url, res.clone()));
+  return res;
+}
+
+// ── Messages from the page ─────────────────────────────────────────────────────
 self.addEventListener("message", e => {
-  if (e.data?.type === "SKIP_WAITING") self.skipWaiting();
+  const type = e.data?.type;
+  if (type === "SKIP_WAITING") self.skipWaiting();
+  // {type, urls}: thumbnails the page expects to show next
+  if (type === "PREFETCH_THUMBS") e.waitUntil(prefetchThumbs(e.data.urls || []));
+  // Reply on the transferred MessagePort
+  if (type === "THUMB_STATS") e.waitUntil(thumbCacheStats().then(s => e.ports[0]?.postMessage(s)));
 });
 
+// ── Lifecycle: install ─────────────────────────────────────────────────────────
+
 self.addEventListener("install", e => {
   e.waitUntil(
     caches.open(STATIC_CACHE)
@@ -75,6 +227,13 @@ self.addEventListener("activate", e => {
 self.addEventListener("fetch", e => {
   const url = new URL(e.request.url);
 
+  // Thumbnails — cache first (immutable per id), LRU-bounded; checked before
+  // the /api/ rule since most thumbnail routes live under /api/
+  if (THUMB_PREFIXES.some(p => url.pathname.startsWith(p))) {
+    e.respondWith(serveThumb(e));
+    return;
+  }
+
   // API calls — network only, never cache (except version which is cheap)
   if (url.pathname.startsWith("/api/")) {
     if (url.pathname === "/api/version") {
@@ -89,31 +248,22 @@ self.addEventListener("fetch", e => {
     return;
   }
 
-  // Thumbnails — cache first (long-lived), serve stale while updating
-  if (url.pathname.startsWith("/api/thumbnail/") ||
-      url.pathname.startsWith("/api/wa-thumbnail/") ||
-      url.pathname.startsWith("/static/thumbnails_cache/")) {
-    e.respondWith(
-      caches.open(THUMB_CACHE).then(c =>
-        c.match(e.request).then(cached => {
-          const net = fetch(e.request).then(res => {
-            if (res?.status === 200) c.put(e.request, res.clone());
-            return res;
-          }).catch(() => null);
-          return cached || net;
-        })
-      )
-    );
-    return;
-  }
-
-  // HTML navigation — network first, fall back to offline shell
+  // HTML navigation — network first; offline, serve the last app shell (which
+  // can review a saved offline bundle), else the static offline page
   if (e.request.mode === "navigate") {
     e.respondWith(
       fetch(e.request)
-        .catch(() => new Response(OFFLINE_HTML, {
-          headers: { "Content-Type": "text/html; charset=utf-8" }
-        }))
+        .then(res => {
+          if (res.status === 200 && url.pathname === "/") {
+            const copy = res.clone();
+            e.waitUntil(caches.open(STATIC_CACHE).then(c => c.put("/", copy)));
+          }
+          return res;
+        })
+        .catch(async () => (url.pathname === "/" && await caches.match("/")) ||
+          new Response(OFFLINE_HTML, {
+            headers: { "Content-Type": "text/html; charset=utf-8" }
+          }))
     );
     return;
   }